@@ -1,20 +1,20 @@
 import os
+import atexit
 import logging
 import argparse
+import csv
+import multiprocessing
 import concurrent.futures
-import pandas as pd
+from concurrent.futures.process import BrokenProcessPool
 import time
 from pathlib import Path
 from tqdm import tqdm
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 # Add parent directory to path if needed
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Import the document processing function
-from ocr_main import process_document
-
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -26,6 +26,176 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Columns of processing_summary.csv
+SUMMARY_FIELDS = ["file", "status", "rows", "processing_time", "error"]
+
+# Log full tracebacks for per-file failures (set by --verbose)
+DEBUG_TB = False
+
+# Preprocessing threads per document in a pool worker; the workers already run in parallel
+WORKER_PREPROCESS_THREADS = 2
+
+# Pool workers allowed to load the OCR model onto the GPU; the rest run it on CPU,
+# so N workers do not each put a copy of the model in GPU memory
+GPU_WORKERS = 1
+
+# Per-worker handle to the document processing function, set by _worker_init
+_process_document = None
+
+# Whether this worker holds one of the GPU_WORKERS slots, set by _worker_init
+_use_gpu = True
+
+# Persistent process pool shared across batch_process calls
+_executor = None
+_executor_workers = None
+_executor_debug_tb = None
+
+def _worker_init(debug_tb: bool = False, gpu_slots=None) -> None:
+    """
+    Initialize a pool worker by importing the OCR pipeline and loading the
+    OCR model once, so that tasks scheduled on this worker skip the cold
+    import of DocTR/OpenCV/pandas and the model load.
+    
+    Args:
+        debug_tb: Whether the worker should log full tracebacks on failure
+        gpu_slots: Semaphore shared by the pool's workers, held for life by each
+            worker that runs the model on the GPU (None outside a pool)
+    """
+    global _process_document, _use_gpu, DEBUG_TB
+    DEBUG_TB = debug_tb
+    _use_gpu = gpu_slots is None or gpu_slots.acquire(block=False)
+    from ocr_main import process_document, _get_model
+    if gpu_slots is not None:
+        # Pool workers already run in parallel, each with its own preprocessing threads
+        from preprocess import set_num_threads
+        set_num_threads(1)
+    # Same arguments as process_document's call, so the lru_cache entry is reused
+    _get_model(half_precision=True, use_gpu=_use_gpu)
+    _process_document = process_document
+
+def _get_executor(max_workers: int) -> concurrent.futures.ProcessPoolExecutor:
+    """
+    Return the persistent process pool, creating it on first use or when the
+    requested number of workers or DEBUG_TB changes.
+    
+    Args:
+        max_workers: Number of parallel workers
+        
+    Returns:
+        A ProcessPoolExecutor whose workers have already run _worker_init
+    """
+    global _executor, _executor_workers, _executor_debug_tb
+    if _executor is None or _executor_workers != max_workers or _executor_debug_tb != DEBUG_TB:
+        _shutdown_executor()
+        _executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_worker_init,
+            initargs=(DEBUG_TB, multiprocessing.Semaphore(GPU_WORKERS))
+        )
+        _executor_workers = max_workers
+        _executor_debug_tb = DEBUG_TB
+    return _executor
+
+def _shutdown_executor(wait: bool = True) -> None:
+    """
+    Shut down the persistent process pool, so the next _get_executor call creates a new one.
+    
+    Args:
+        wait: Whether to wait for running tasks (False for a pool that is already broken)
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait, cancel_futures=not wait)
+        _executor = None
+
+def _submit_files(max_workers: int, files: List[Path], output_dir: Path) -> Dict:
+    """
+    Submit one process_single_file task per file to the persistent pool.
+    
+    A pool left broken by a worker that died in an earlier batch is shut
+    down and rebuilt once before giving up.
+    
+    Args:
+        max_workers: Number of parallel workers
+        files: Paths of the files to process
+        output_dir: Directory to save the output CSVs
+        
+    Returns:
+        Dictionary mapping each future to its file path
+    """
+    try:
+        executor = _get_executor(max_workers)
+        return {executor.submit(process_single_file, str(f), output_dir): f for f in files}
+    except BrokenProcessPool:
+        logger.warning("Process pool is broken, starting a new one")
+        _shutdown_executor(wait=False)
+        executor = _get_executor(max_workers)
+        return {executor.submit(process_single_file, str(f), output_dir): f for f in files}
+
+atexit.register(_shutdown_executor)
+
+def _iter_completed(futures):
+    """
+    Yield futures as they complete, draining already-finished futures first.
+    
+    Futures that are done by the time iteration starts are yielded directly,
+    so as_completed only installs waiters on the ones still pending.
+    
+    Args:
+        futures: Iterable of futures to wait on
+        
+    Yields:
+        Completed futures
+    """
+    done = []
+    pending = []
+    for future in futures:
+        (done if future.done() else pending).append(future)
+    
+    yield from done
+    if pending:
+        yield from concurrent.futures.as_completed(pending)
+
+def _is_valid_pdf(file_path: Path) -> bool:
+    """
+    Cheaply check that a PDF is non-empty and readable by Poppler.
+    
+    Only a missing/empty file or a Poppler parse failure marks the file
+    invalid. Without pdf2image or Poppler, or on any other pdfinfo error,
+    the file is scheduled and the worker reports any problem with it.
+    
+    Args:
+        file_path: Path to the input file
+        
+    Returns:
+        True if the file can be scheduled for processing
+    """
+    try:
+        if file_path.stat().st_size == 0:
+            return False
+    except OSError:
+        return False
+    
+    if file_path.suffix.lower() != ".pdf":
+        return True
+    
+    try:
+        from pdf2image import pdfinfo_from_path
+        from pdf2image.exceptions import PDFInfoNotInstalledError, PDFPageCountError, PDFSyntaxError
+    except ImportError:
+        return True
+    
+    try:
+        pdfinfo_from_path(str(file_path))
+    except (PDFPageCountError, PDFSyntaxError):
+        return False
+    except PDFInfoNotInstalledError:
+        logger.debug(f"pdfinfo not available, skipping preflight check of {file_path}")
+    except Exception as e:
+        # Not a parse failure (e.g. a pdfinfo timeout); let the worker report it
+        logger.debug(f"Preflight check of {file_path} inconclusive: {e}")
+    return True
+
 def process_single_file(file_path: str, output_dir: Path) -> Dict:
     """
     Process a single document file and return results.
@@ -44,13 +214,16 @@ def process_single_file(file_path: str, output_dir: Path) -> Dict:
         output_file = output_dir / f"{os.path.splitext(file_name)[0]}.csv"
         
         logger.info(f"Starting processing of {file_path}")
-        process_document(file_path, str(output_file))
+        if _process_document is None:
+            _worker_init(DEBUG_TB)
+        _process_document(file_path, str(output_file), preprocess_workers=WORKER_PREPROCESS_THREADS,
+                          use_gpu=_use_gpu)
         
         # Check if output was created and has content
         if os.path.exists(output_file) and os.path.getsize(output_file) > 0:
-            # Count rows in CSV (subtract 1 for header)
-            with open(output_file, 'r') as f:
-                row_count = sum(1 for _ in f) - 1
+            # Count rows in CSV (subtract 1 for header) by scanning raw bytes for newlines
+            with open(output_file, 'rb') as f:
+                row_count = sum(buf.count(b'\n') for buf in iter(lambda: f.read(1 << 20), b'')) - 1
                 
             processing_time = time.time() - start_time
             
@@ -59,7 +232,8 @@ def process_single_file(file_path: str, output_dir: Path) -> Dict:
                 "file": file_path,
                 "status": "success",
                 "rows": row_count,
-                "processing_time": processing_time
+                "processing_time": processing_time,
+                "error": ""
             }
         else:
             logger.error(f"Processing completed but no output generated for {file_path}")
@@ -67,28 +241,29 @@ def process_single_file(file_path: str, output_dir: Path) -> Dict:
                 "file": file_path,
                 "status": "empty_output",
                 "rows": 0,
-                "processing_time": time.time() - start_time
+                "processing_time": time.time() - start_time,
+                "error": "No output generated"
             }
             
     except Exception as e:
         processing_time = time.time() - start_time
-        logger.error(f"Error processing {file_path}: {str(e)}", exc_info=True)
+        logger.error("Error processing %s: %s", file_path, e, exc_info=DEBUG_TB)
         return {
             "file": file_path,
             "status": "error",
-            "error": str(e),
             "rows": 0,
-            "processing_time": processing_time
+            "processing_time": processing_time,
+            "error": str(e)
         }
 
-def batch_process(input_dir: str, output_dir: str, max_workers: int = 4, file_pattern: str = "*.pdf") -> None:
+def batch_process(input_dir: str, output_dir: str, max_workers: Optional[int] = None, file_pattern: str = "*.pdf") -> None:
     """
     Process all matching files in the input directory.
     
     Args:
         input_dir: Directory containing input PDF files
         output_dir: Directory to save output CSV files
-        max_workers: Number of parallel workers
+        max_workers: Number of parallel workers, or None to size the pool from the CPU count
         file_pattern: File pattern to match (e.g., "*.pdf")
     """
     input_path = Path(input_dir)
@@ -105,46 +280,85 @@ def batch_process(input_dir: str, output_dir: str, max_workers: int = 4, file_pa
         
     logger.info(f"Found {total_files} files to process")
     
+    # Filter out empty or unreadable PDFs before they occupy a worker slot
+    valid_files = []
+    invalid_results = []
+    for file_path in all_files:
+        if _is_valid_pdf(file_path):
+            valid_files.append(file_path)
+        else:
+            logger.warning(f"Skipping invalid PDF: {file_path}")
+            invalid_results.append({
+                "file": str(file_path),
+                "status": "invalid_pdf",
+                "rows": 0,
+                "processing_time": 0,
+                "error": "Empty or unreadable PDF"
+            })
+    
     # Create a summary file to track progress
     summary_file = output_path / "processing_summary.csv"
-    results = []
-    
-    # Process files with parallel workers
-    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all tasks
-        future_to_file = {
-            executor.submit(process_single_file, str(file_path), output_path): file_path 
-            for file_path in all_files
-        }
+    success_count = 0
+    total_rows = 0
+    sum_time = 0.0
+    failures = list(invalid_results)
+    
+    # OCR is CPU-bound: use one worker per core, but don't start more than the batch needs
+    if max_workers is None:
+        max_workers = min(os.cpu_count() or 4, max(2, len(valid_files)))
+    
+    # Process files with the persistent pool of parallel workers
+    future_to_file = _submit_files(max_workers, valid_files, output_path)
+    
+    # Process results as they complete, appending one summary row per file
+    with open(summary_file, 'w', newline='') as summary_fh, \
+            tqdm(total=len(future_to_file), desc="Processing files",
+                 mininterval=0.5, smoothing=0.1) as pbar:
+        writer = csv.DictWriter(summary_fh, fieldnames=SUMMARY_FIELDS, restval="")
+        writer.writeheader()
+        writer.writerows(invalid_results)
         
-        # Process results as they complete
-        for future in tqdm(concurrent.futures.as_completed(future_to_file), total=len(all_files), desc="Processing files"):
+        for future in _iter_completed(future_to_file):
             file_path = future_to_file[future]
             try:
                 result = future.result()
-                results.append(result)
-                
-                # Update summary file regularly
-                pd.DataFrame(results).to_csv(summary_file, index=False)
-                
+            except BrokenProcessPool as e:
+                # A worker died; drop the pool so the next batch starts a fresh one
+                logger.error("Worker crashed processing %s: %s", file_path, e)
+                _shutdown_executor(wait=False)
+                result = {
+                    "file": str(file_path),
+                    "status": "executor_error",
+                    "rows": 0,
+                    "processing_time": 0,
+                    "error": str(e) or "Process pool is broken"
+                }
             except Exception as e:
-                logger.error(f"Exception processing {file_path}: {str(e)}", exc_info=True)
-                results.append({
+                logger.error("Exception processing %s: %s", file_path, e, exc_info=DEBUG_TB)
+                result = {
                     "file": str(file_path),
                     "status": "executor_error",
-                    "error": str(e),
                     "rows": 0,
-                    "processing_time": 0
-                })
-    
-    # Create final summary report
-    summary_df = pd.DataFrame(results)
-    summary_df.to_csv(summary_file, index=False)
+                    "processing_time": 0,
+                    "error": str(e)
+                }
+            
+            # Accumulate summary statistics as results stream in
+            sum_time += result["processing_time"]
+            if result["status"] == "success":
+                success_count += 1
+                total_rows += result["rows"]
+            else:
+                failures.append(result)
+            
+            # Keep the summary file current without rewriting it
+            writer.writerow(result)
+            summary_fh.flush()
+            pbar.update(1)
+            pbar.set_postfix(success=success_count, refresh=False)
     
     # Print summary statistics
-    success_count = len(summary_df[summary_df['status'] == 'success'])
-    total_rows = summary_df['rows'].sum()
-    avg_time = summary_df['processing_time'].mean()
+    avg_time = sum_time / total_files
     
     logger.info(f"Batch processing complete: {success_count}/{total_files} files successful")
     logger.info(f"Total rows extracted: {total_rows}")
@@ -152,18 +366,22 @@ def batch_process(input_dir: str, output_dir: str, max_workers: int = 4, file_pa
     
     if success_count < total_files:
         logger.warning(f"Failed files: {total_files - success_count}")
-        for _, row in summary_df[summary_df['status'] != 'success'].iterrows():
-            logger.warning(f"  {row['file']} - {row['status']}: {row.get('error', 'Unknown error')}")
+        for failure in failures:
+            logger.warning(f"  {failure['file']} - {failure['status']}: {failure['error']}")
 
 def main():
     parser = argparse.ArgumentParser(description="Batch OCR processing for historical postal service tables")
     parser.add_argument('--input_dir', type=str, required=True, help='Directory containing input PDF files')
     parser.add_argument('--output_dir', type=str, required=True, help='Directory for output CSV files')
-    parser.add_argument('--workers', type=int, default=4, help='Number of parallel workers')
+    parser.add_argument('--workers', type=int, default=None, help='Number of parallel workers (default: based on CPU count)')
     parser.add_argument('--pattern', type=str, default="*.pdf", help='File pattern to match (e.g., "*.pdf")')
+    parser.add_argument('--verbose', action='store_true', help='Log full tracebacks for failed files')
     
     args = parser.parse_args()
     
+    global DEBUG_TB
+    DEBUG_TB = args.verbose
+    
     batch_process(args.input_dir, args.output_dir, args.workers, args.pattern)
 
 if __name__ == "__main__":
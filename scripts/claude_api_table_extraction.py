@@ -1,63 +1,568 @@
 import anthropic
-import base64
+import asyncio
+import concurrent.futures
+import functools
+import hashlib
+import httpx
+import importlib.util
+import json
 import os
+import numpy as np
 import pandas as pd
 import io
+import queue
 import time
+import random
 import re
+import threading
 import csv 
-from pdf2image import convert_from_path
-import tempfile
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import Image
 import argparse
 from typing import List, Optional, Dict, Any, Tuple
 
+# pybase64 is a SIMD-accelerated drop-in for the stdlib base64 module
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+# orjson is a much faster JSON encoder; fall back to the stdlib without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# PyMuPDF renders pages in-process; fall back to Poppler (pdf2image) without it
+try:
+    import fitz
+except ImportError:
+    fitz = None
+
+# Keep-alive pool size for connections to the Anthropic API
+HTTP_POOL_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=32)
+
+# Use HTTP/2 when the optional h2 package is installed
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Subdirectory of the output directory holding content-hashed page extractions
+PAGE_CACHE_DIRNAME = ".page_cache"
+
+# Per-page Parquet results let re-runs skip pages that were already extracted;
+# their confidence and source fingerprint live in the Arrow schema metadata
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Schema metadata keys of a stored page result
+RESUME_META_CONFIDENCE = b'confidence'
+RESUME_META_SOURCE_SIZE = b'source_size'
+RESUME_META_SOURCE_MTIME = b'source_mtime_ns'
+
+# Image encodings accepted for page images, and the JPEG quality used
+IMAGE_FORMATS = ('jpeg', 'png')
+JPEG_QUALITY = 85
+
+# Encoded PDF pages kept in memory per extractor: enough for a page requested again
+# right away (e.g. a retry) without holding a long document's images; older pages are
+# rendered again
+ENCODED_PAGE_CACHE_SIZE = 4
+
+# Smallest page side (in pixels) worth sending after halving an oversized image
+MIN_IMAGE_SIDE = 400
+
+# Minimum confidence for a stored page result (resume file or page cache entry) to be
+# written and reused; anything lower is retried on the next run
+RESUME_MIN_CONFIDENCE = 0.9
+
+# Standard columns of the combined output
+COMBINED_COLUMNS = ['Name', 'Where born', 'Whence appointed', 'Post-office',
+                    'Compensation per annum', 'State', 'Postmaster', 'salary_clean',
+                    'extraction_confidence']
+
+# Claude model used for table extraction
+CLAUDE_MODEL = "claude-3-7-sonnet-20250219"
+
+# Extraction instructions sent with every page image
+EXTRACTION_PROMPT = """This image contains a table with postal clerk data. Extract all data into CSV format with these columns: Name, Where born, Whence appointed, Post-office, Compensation per annum, State.
+
+                                        Important formatting instructions:
+                                            1. Keep suffixes like Jr., Sr., or III as part of the Name field - don't let these shift data into other columns
+                                            2. For compensation values:
+                                                - VERY IMPORTANT: Remove any commas from dollar amounts (e.g., '$1,000.00' should be '$1000.00')
+                                                - Remove any spaces between dollars and cents and account for the decimal (e.g., '$100 00' should be '$100.00')
+                                                - Pay special attention to monetary amounts, ensuring the correct number of zeros
+                                                - Look carefully at each digit in salary amounts to avoid misreading
+                                                - Standardize monetary values to a consistent format
+                                            3. Transcribe 'do' (ditto) cells and 'p.m.' markers exactly as printed
+                                            4. If any field might contain a comma (especially in monetary values), ensure it's properly quoted
+                                            5. If on any given page a new table starts with a new table heading, ignore it and do not add the data
+
+                                        Only respond with the raw CSV data, no explanations or markdown formatting."""
+
+# Space between dollars and cents in a monetary value, e.g. "900 00"
+MONEY_SPACE_RE = re.compile(r'(\$?\d+)\s+(\d{2})')
+
+# HTTP client shared by every TableExtractor in this process
+_shared_http_client = None
+
+def _get_shared_http_client():
+    """
+    Return the process-wide HTTP client, creating it on first use.
+    
+    Sharing one client keeps its TCP/TLS connections warm across pages,
+    documents and extractor instances.
+    
+    Returns:
+        An httpx client configured with Anthropic's defaults
+    """
+    global _shared_http_client
+    if _shared_http_client is None:
+        _shared_http_client = anthropic.DefaultHttpxClient(limits=HTTP_POOL_LIMITS, http2=HTTP2_AVAILABLE)
+    return _shared_http_client
+
+class CombinedTableWriter:
+    """
+    Stream per-page tables into a document's combined and high-confidence CSVs.
+    
+    The header starts as the first non-empty page's columns plus any missing
+    standard columns. A later page that brings new columns extends it: the
+    rows written so far are rewritten under the wider header (rare, as pages
+    of one register share a layout), then appending continues.
+    """
+    
+    def __init__(self, output_dir: str, file_base: str):
+        """
+        Args:
+            output_dir: Directory to save the CSV files
+            file_base: Base name used for output files
+        """
+        self.combined_path = os.path.join(output_dir, f"{file_base}_combined.csv")
+        self.high_conf_path = os.path.join(output_dir, f"{file_base}_combined_high_confidence.csv")
+        self.columns = None
+        self._combined_file = None
+        self._high_conf_file = None
+    
+    def write(self, df: pd.DataFrame, confidence: float) -> None:
+        """
+        Append one page's table to the combined files.
+        
+        Args:
+            df: Extracted table for the page
+            confidence: Confidence score of the page's extraction, used for rows
+                without their own extraction_confidence
+        """
+        if df.empty:
+            return
+        
+        # Cleanly parsed pages carry no per-row confidence; their rows get the page's
+        if 'extraction_confidence' in df.columns:
+            df = df.assign(extraction_confidence=df['extraction_confidence'].fillna(confidence))
+        else:
+            df = df.assign(extraction_confidence=confidence)
+        
+        header = self.columns is None
+        if header:
+            self.columns = list(df.columns) + [col for col in COMBINED_COLUMNS if col not in df.columns]
+            self._combined_file = open(self.combined_path, 'w', newline='')
+            self._high_conf_file = open(self.high_conf_path, 'w', newline='')
+        else:
+            new_columns = [col for col in df.columns if col not in self.columns]
+            if new_columns:
+                self._extend_columns(new_columns)
+        
+        df = df.reindex(columns=self.columns)
+        df.to_csv(self._combined_file, index=False, header=header)
+        
+        # Also keep a filtered version with only high-confidence rows
+        df[df['extraction_confidence'] > 0.7].to_csv(self._high_conf_file, index=False, header=header)
+    
+    def _extend_columns(self, new_columns: List[str]) -> None:
+        """
+        Add columns to the header, rewriting the rows already written under it.
+        
+        Args:
+            new_columns: Columns to append to the header
+        """
+        print(f"Adding columns to the combined table: {new_columns}")
+        self.columns = self.columns + new_columns
+        for attr, path in (('_combined_file', self.combined_path),
+                           ('_high_conf_file', self.high_conf_path)):
+            getattr(self, attr).close()
+            # Read back as text so existing values are rewritten unchanged
+            written = pd.read_csv(path, dtype=str, keep_default_na=False)
+            written.reindex(columns=self.columns, fill_value='').to_csv(path, index=False)
+            setattr(self, attr, open(path, 'a', newline=''))
+    
+    def close(self) -> None:
+        """Close the output files."""
+        if self._combined_file is None:
+            return
+        self._combined_file.close()
+        self._high_conf_file.close()
+        self._combined_file = self._high_conf_file = None
+        print(f"Saved combined table to {self.combined_path}")
+        print(f"Saved high-confidence rows to {self.high_conf_path}")
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class RateLimiter:
+    """
+    Thread-safe token bucket limiting how many API requests start per second.
+    """
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate: Sustained number of requests allowed per second
+            capacity: Maximum burst size (defaults to max(1, rate))
+        """
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self) -> None:
+        """Block until a request may be started."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
 class TableExtractor:
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, dpi: int = 200, per_page_csv: bool = False,
+                 rps_limit: Optional[float] = None, use_pymupdf: bool = True,
+                 image_format: str = 'jpeg'):
         """
         Initialize the TableExtractor with the Anthropic API key.
         
         Args:
             api_key: Anthropic API key. If None, it will try to get it from the environment variable.
+            dpi: Resolution used when rasterizing PDF pages
+            per_page_csv: Also write a CSV and metadata file for every page
+            rps_limit: Maximum API requests started per second, or None for no limit
+            use_pymupdf: Render pages with PyMuPDF when it is installed instead of Poppler
+            image_format: Encoding of page images sent to Claude ('jpeg' or 'png')
         """
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"image_format must be one of {IMAGE_FORMATS}, got {image_format!r}")
+        
         self.api_key = api_key or os.environ.get("ANTHROPIC_API_KEY")
         if not self.api_key:
             raise ValueError("Anthropic API key is required. Either pass it as an argument or set the ANTHROPIC_API_KEY environment variable.")
         
-        self.client = anthropic.Anthropic(api_key=self.api_key)
+        self.dpi = dpi
+        self.image_format = image_format
+        self.per_page_csv = per_page_csv
+        self.use_pymupdf = use_pymupdf and fitz is not None
+        self.rate_limiter = RateLimiter(rps_limit) if rps_limit else None
+        # Encoded pages keyed by (path, mtime, size, page), so edited PDFs never hit stale entries
+        self._encoded_pages = functools.lru_cache(maxsize=ENCODED_PAGE_CACHE_SIZE)(self._render_and_encode_page)
+        # Extractions of the current document keyed by image content, so duplicate pages share one call
+        self._page_futures = {}
+        self._page_futures_lock = threading.Lock()
+        self.client = self._create_client()
+    
+    def _create_client(self):
+        """
+        Create the Anthropic client used for API requests.
+        
+        Returns:
+            An Anthropic client instance
+        """
+        return anthropic.Anthropic(api_key=self.api_key, http_client=_get_shared_http_client())
+    
+    def _render_pages(self, pdf_path: str, first_page: int, last_page: int) -> list:
+        """
+        Rasterize a range of PDF pages, in-process with PyMuPDF or with a single Poppler call.
+        
+        Args:
+            pdf_path: Path to the PDF file
+            first_page: First page to render (1-indexed)
+            last_page: Last page to render (inclusive)
+            
+        Returns:
+            List of PIL Images, one per page
+        """
+        if self.use_pymupdf:
+            images = []
+            with fitz.open(pdf_path) as doc:
+                for page_index in range(first_page - 1, last_page):
+                    pix = doc.load_page(page_index).get_pixmap(dpi=self.dpi, alpha=False)
+                    images.append(Image.frombytes("RGB", (pix.width, pix.height), pix.samples))
+            return images
+        
+        return convert_from_path(pdf_path, dpi=self.dpi, first_page=first_page, last_page=last_page)
+    
+    def _page_count(self, pdf_path: str) -> int:
+        """
+        Get the number of pages in a PDF without rendering it.
+        
+        Args:
+            pdf_path: Path to the PDF file
+            
+        Returns:
+            Number of pages
+        """
+        if self.use_pymupdf:
+            with fitz.open(pdf_path) as doc:
+                return doc.page_count
+        return pdfinfo_from_path(pdf_path)['Pages']
+    
+    def _image_bytes(self, image) -> bytes:
+        """
+        Encode a PIL image to JPEG or PNG bytes in memory.
+        
+        Args:
+            image: PIL Image of a rendered page
+            
+        Returns:
+            Encoded image bytes
+        """
+        # Encode straight from memory rather than via a temporary file
+        buf = io.BytesIO()
+        if self.image_format == 'jpeg':
+            # JPEG at quality 85 is several times smaller than PNG with no loss of legibility
+            if image.mode != 'RGB':
+                image = image.convert('RGB')
+            image.save(buf, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+        else:
+            # The PNG is sent once and discarded, so favor encode speed over size
+            image.save(buf, 'PNG', compress_level=1, optimize=False)
+        return buf.getvalue()
+    
+    def _pil_to_b64(self, image) -> str:
+        """
+        Encode a PIL image as base64 for an image content block.
+        
+        Args:
+            image: PIL Image of a rendered page
+            
+        Returns:
+            Base64 encoded image
+        """
+        return base64.b64encode(self._image_bytes(image)).decode('ascii')
+    
+    def _encode_page(self, image_bytes: bytes) -> Tuple[str, str]:
+        """
+        Compute the content key and base64 payload for an encoded page image.
+        
+        Args:
+            image_bytes: Encoded page image
+            
+        Returns:
+            Tuple of (content hash of the image, base64 encoded image)
+        """
+        key = hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+        return key, base64.b64encode(image_bytes).decode('ascii')
+    
+    def _render_and_encode_page(self, pdf_path: str, mtime_ns: int, size: int,
+                                page_number: int) -> Tuple[str, str]:
+        """
+        Render and encode one PDF page; wrapped in an LRU cache by __init__.
+        
+        Args:
+            pdf_path: Absolute path to the PDF file
+            mtime_ns: Modification time of the PDF, part of the cache key
+            size: Size of the PDF in bytes, part of the cache key
+            page_number: Page number to render (1-indexed)
+            
+        Returns:
+            Tuple of (content hash of the image, base64 encoded image)
+        """
+        images = self._render_pages(pdf_path, page_number, page_number)
+        return self._encode_page(self._image_bytes(images[0]))
+    
+    def _encode_pdf_page(self, pdf_path: str, page_number: int) -> Tuple[str, str]:
+        """
+        Get the encoded image of a PDF page, reusing it if the page was encoded before.
+        
+        Args:
+            pdf_path: Path to the PDF file
+            page_number: Page number to render (1-indexed)
+            
+        Returns:
+            Tuple of (content hash of the image, base64 encoded image)
+        """
+        pdf_path = os.path.abspath(pdf_path)
+        st = os.stat(pdf_path)
+        return self._encoded_pages(pdf_path, st.st_mtime_ns, st.st_size, page_number)
+    
+    def _page_cache_path(self, cache_dir: str, image_key: str) -> str:
+        """
+        Get the cache file for a page image, keyed by a hash of its content.
+        
+        Args:
+            cache_dir: Directory holding cached extractions
+            image_key: Content hash of the page image, from _encode_page
+            
+        Returns:
+            Path to the cached CSV for this image
+        """
+        return os.path.join(cache_dir, f"{image_key}.csv")
+    
+    def _read_page_cache(self, cache_path: str) -> Optional[Tuple[pd.DataFrame, float]]:
+        """
+        Load a previously cached extraction for a page image.
+        
+        Args:
+            cache_path: Path returned by _page_cache_path
+            
+        Returns:
+            Tuple of (DataFrame, confidence), or None if there is no usable entry
+        """
+        if not os.path.exists(cache_path):
+            return None
+        
+        with open(cache_path, 'r') as f:
+            df, confidence = self._parse_csv_with_confidence(f.read())
+        if df.empty or confidence < RESUME_MIN_CONFIDENCE:
+            return None
+        
+        return self._finalize_extraction(df, confidence)
+    
+    def _write_page_cache(self, cache_path: str, csv_text: Optional[str], confidence: float) -> None:
+        """
+        Store Claude's raw CSV response for a page image, if it is confident enough to reuse.
+        
+        Args:
+            cache_path: Path returned by _page_cache_path
+            csv_text: Raw CSV text of the best extraction attempt
+            confidence: Confidence score of that attempt
+        """
+        if csv_text is None or confidence < RESUME_MIN_CONFIDENCE:
+            return
+        
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, 'w') as f:
+            f.write(csv_text)
     
-    def _encode_image(self, image_path: str) -> str:
+    def _resume_path(self, output_dir: str, file_base: str, page_num: int) -> str:
         """
-        Encode an image file to base64.
+        Get the stored result file for a page of a document.
         
         Args:
-            image_path: Path to the image file
+            output_dir: Directory to save the CSV files
+            file_base: Base name used for output files
+            page_num: Page number (1-indexed)
             
         Returns:
-            Base64 encoded string of the image
+            Path to the page's Parquet file
         """
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+        return os.path.join(output_dir, PAGE_CACHE_DIRNAME, f"{file_base}_page_{page_num}.parquet")
     
-    def _convert_pdf_page_to_image(self, pdf_path: str, page_number: int) -> str:
+    def _source_stamp(self, pdf_path: str) -> Dict[bytes, bytes]:
         """
-        Convert a specific page of a PDF to an image.
+        Get the fingerprint of a source PDF stored with its page results.
         
         Args:
             pdf_path: Path to the PDF file
-            page_number: Page number to convert (1-indexed)
             
         Returns:
-            Path to the temporary image file
+            Schema metadata entries identifying the current version of the file
+        """
+        st = os.stat(pdf_path)
+        return {
+            RESUME_META_SOURCE_SIZE: str(st.st_size).encode(),
+            RESUME_META_SOURCE_MTIME: str(st.st_mtime_ns).encode(),
+        }
+    
+    def _load_resumed_page(self, resume_path: str,
+                           source_stamp: Dict[bytes, bytes]) -> Optional[Tuple[pd.DataFrame, float]]:
         """
-        # Convert PDF page to image (1-indexed to 0-indexed)
-        images = convert_from_path(pdf_path, first_page=page_number, last_page=page_number)
+        Load a page result stored by a previous run, if it is confident enough to reuse.
         
-        # Save the image to a temporary file
-        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
-            temp_path = temp_file.name
-            images[0].save(temp_path, 'PNG')
+        Args:
+            resume_path: Path returned by _resume_path
+            source_stamp: Fingerprint of the source PDF, as returned by _source_stamp
+            
+        Returns:
+            Tuple of (DataFrame, confidence), or None if the page must be extracted
+        """
+        if pq is None or not os.path.exists(resume_path):
+            return None
         
-        return temp_path
+        try:
+            table = pq.read_table(resume_path)
+            meta = table.schema.metadata or {}
+            confidence = float(meta.get(RESUME_META_CONFIDENCE, b'0'))
+        except Exception as e:
+            print(f"Ignoring unreadable stored result {resume_path}: {str(e)}")
+            return None
+        
+        # Results of a different (or modified) PDF with the same basename are stale
+        if any(meta.get(key) != value for key, value in source_stamp.items()):
+            return None
+        if confidence < RESUME_MIN_CONFIDENCE:
+            return None
+        return table.to_pandas(), confidence
+    
+    def _store_resumed_page(self, resume_path: str, df: pd.DataFrame, confidence: float,
+                            source_stamp: Dict[bytes, bytes]) -> None:
+        """
+        Store a confident page result so a re-run can skip the page.
+        
+        Object columns are stored as nullable strings, since they can mix
+        types (salary_clean holds ints, None and unparseable strings).
+        Tables with repeated column names cannot be stored in Arrow and are
+        extracted again on the next run.
+        
+        Args:
+            resume_path: Path returned by _resume_path
+            df: Extracted table for the page
+            confidence: Confidence score of the extraction
+            source_stamp: Fingerprint of the source PDF, as returned by _source_stamp
+        """
+        if pq is None or confidence < RESUME_MIN_CONFIDENCE or df.columns.has_duplicates:
+            return
+        
+        text_cols = df.select_dtypes(include='object').columns
+        table = pa.Table.from_pandas(df.astype({col: 'string' for col in text_cols}), preserve_index=False)
+        meta = dict(table.schema.metadata or {})
+        meta.update(source_stamp)
+        meta[RESUME_META_CONFIDENCE] = repr(float(confidence)).encode()
+        
+        os.makedirs(os.path.dirname(resume_path), exist_ok=True)
+        pq.write_table(table.replace_schema_metadata(meta), resume_path)
+    
+    def _load_resumed_pages(self, output_dir: str, file_base: str, start_page: int, end_page: int,
+                            source_stamp: Dict[bytes, bytes]) -> Dict[int, Tuple[pd.DataFrame, float]]:
+        """
+        Load every reusable page result of a document from a previous run.
+        
+        Args:
+            output_dir: Directory to save the CSV files
+            file_base: Base name used for output files
+            start_page: First page to process (1-indexed)
+            end_page: Last page to process (inclusive)
+            source_stamp: Fingerprint of the source PDF, as returned by _source_stamp
+            
+        Returns:
+            Dictionary mapping page number to (DataFrame, confidence)
+        """
+        resumed = {}
+        for page_num in range(start_page, end_page + 1):
+            cached = self._load_resumed_page(self._resume_path(output_dir, file_base, page_num),
+                                             source_stamp)
+            if cached is not None:
+                resumed[page_num] = cached
+        
+        if resumed:
+            print(f"Reusing {len(resumed)} previously extracted pages")
+        return resumed
     
     def _clean_csv_text(self, csv_text: str) -> str:
         """
@@ -71,15 +576,10 @@ class TableExtractor:
         """
         # Replace spaces in monetary values with empty strings
         # This handles cases like "p.m. 900 00" -> "p.m.90000"
-        cleaned_text = re.sub(r'(\$?\d+)\s+(\d{2})', r'\1\2', csv_text)
-        
-        # If there are dollar signs, make sure they're properly formatted
-        cleaned_text = re.sub(r'(\$)(\d+)', r'\1\2', cleaned_text)
+        cleaned_text = MONEY_SPACE_RE.sub(r'\1\2', csv_text)
         
         # Remove any extra quotes that might cause parsing issues
-        cleaned_text = cleaned_text.replace('""', '"')
-        
-        return cleaned_text
+        return cleaned_text.replace('""', '"')
     
     def _clean_salary_value(self, salary_str):
         """
@@ -117,20 +617,6 @@ class TableExtractor:
             # If conversion fails, return the original string
             return salary_str
         
-    def _split_csv_line(self, line: str) -> List[str]:
-        """
-        Split a CSV line properly handling quoted fields and commas within values.
-        
-        Args:
-            line: A CSV line
-            
-        Returns:
-            List of fields
-        """
-        # Use the csv module to properly split the line
-        reader = csv.reader([line])
-        return next(reader)
-    
     def _parse_csv_with_confidence(self, csv_text: str) -> Tuple[pd.DataFrame, float]:
         """
         Parse CSV text and assign a confidence score based on parsing success.
@@ -141,10 +627,22 @@ class TableExtractor:
         Returns:
             Tuple of (DataFrame, confidence_score)
         """
+        # Claude usually follows the formatting instructions, so try the raw text
+        # before running the cleanup passes over it
+        try:
+            df = pd.read_csv(io.StringIO(csv_text), quoting=csv.QUOTE_ALL)
+            comp = df.get('Compensation per annum')
+            if comp is not None and pd.api.types.is_string_dtype(comp):
+                # Apply the one cleanup that changes values rather than parseability
+                df['Compensation per annum'] = comp.str.replace(MONEY_SPACE_RE, r'\1\2', regex=True)
+            return df, 1.0
+        except Exception:
+            pass
+        
         # Clean the CSV text
         cleaned_text = self._clean_csv_text(csv_text)
         
-        # Try parsing with standard CSV parser first
+        # Try parsing the cleaned text with the standard CSV parser
         try:
             df = pd.read_csv(io.StringIO(cleaned_text), quoting=csv.QUOTE_ALL)
             return df, 1.0  # High confidence if standard parsing works
@@ -158,50 +656,86 @@ class TableExtractor:
             except Exception:
                 pass
         
-        # If both methods failed, try parsing line by line
-        lines = cleaned_text.strip().split('\n')
-        if len(lines) <= 1:
+        # If both methods failed, parse row by row with a single csv reader, which
+        # keeps quoted commas (e.g. "Smith, Jr.") inside their field
+        rows = list(csv.reader(io.StringIO(cleaned_text.strip())))
+        if len(rows) <= 1:
             # Not enough data to parse
             return pd.DataFrame(), 0.0
         
         # Get the header
-        header = self._split_csv_line(lines[0])
+        header = rows[0]
+        n_cols = len(header)
         
-        # Parse each line manually
-        data = []
-        row_confidences = []
+        # Fill one preallocated array per column, plus the confidences, in a single pass
+        n_rows = len(rows) - 1
+        columns = [np.empty(n_rows, dtype=object) for _ in range(n_cols)]
+        row_confidences = np.empty(n_rows, dtype=np.float32)
         
-        for line in lines[1:]:
-            fields = self._split_csv_line(line)
-            
+        for i, fields in enumerate(rows[1:]):
             # Calculate confidence for this row based on field count match
-            field_count_confidence = min(len(fields) / len(header), 1.0)
-            row_confidences.append(field_count_confidence)
+            row_confidences[i] = min(len(fields) / n_cols, 1.0)
             
             # Truncate or pad the row to match header length
-            if len(fields) > len(header):
+            if len(fields) > n_cols:
                 # If too many fields, combine extra fields into the last column
-                combined_extra = ','.join(fields[len(header)-1:])
-                fields = fields[:len(header)-1] + [combined_extra]
-            elif len(fields) < len(header):
+                combined_extra = ','.join(fields[n_cols-1:])
+                fields = fields[:n_cols-1] + [combined_extra]
+            elif len(fields) < n_cols:
                 # If too few fields, pad with empty strings
-                fields = fields + [''] * (len(header) - len(fields))
+                fields = fields + [''] * (n_cols - len(fields))
             
-            data.append(fields)
+            for column, field in zip(columns, fields):
+                column[i] = field
         
-        # Create DataFrame
-        df = pd.DataFrame(data, columns=header)
+        # Create DataFrame from the column arrays, keeping header order and any repeated names
+        df = pd.DataFrame(dict(enumerate(columns)))
+        df.columns = header
+        df['extraction_confidence'] = row_confidences
         
         # Calculate overall confidence
-        avg_confidence = sum(row_confidences) / len(row_confidences) if row_confidences else 0.5
-        
-        # Add confidence column to DataFrame
-        df['extraction_confidence'] = row_confidences + [1.0] * (len(df) - len(row_confidences))
+        avg_confidence = float(row_confidences.mean())
         
         return df, avg_confidence
     
+    def _build_message_kwargs(self, base64_image: str) -> Dict[str, Any]:
+        """
+        Build the keyword arguments for the Claude messages request.
+        
+        Args:
+            base64_image: Base64 encoded image of the page
+            
+        Returns:
+            Dictionary of arguments for client.messages.create
+        """
+        return {
+            "model": CLAUDE_MODEL,
+            "max_tokens": 4000,
+            "temperature": 0.2,  # Lower temperature for more consistent extraction
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": EXTRACTION_PROMPT
+                        },
+                        {
+                            "type": "image",
+                            "source": {
+                                "type": "base64",
+                                "media_type": f"image/{self.image_format}",
+                                "data": base64_image
+                            }
+                        }
+                    ]
+                }
+            ]
+        }
+    
     def extract_table_from_pdf_page(self, pdf_path: str, page_number: int, 
-                            retry_count: int = 3, retry_delay: int = 2) -> Tuple[pd.DataFrame, float]:
+                            retry_count: int = 3, retry_delay: float = 0.5,
+                            max_retry_time: float = 120.0) -> Tuple[pd.DataFrame, float]:
         """
         Extract a table from a specific page of a PDF using Claude.
         
@@ -209,116 +743,476 @@ class TableExtractor:
             pdf_path: Path to the PDF file
             page_number: Page number to extract (1-indexed)
             retry_count: Number of times to retry on failure
-            retry_delay: Delay in seconds between retries
+            retry_delay: Base delay in seconds for exponential backoff between retries
+            max_retry_time: Maximum total time in seconds to spend retrying
             
         Returns:
             Tuple of (DataFrame containing the extracted table, confidence score)
         """
-        # Convert PDF page to image
-        image_path = self._convert_pdf_page_to_image(pdf_path, page_number)
+        image_key, base64_image = self._encode_pdf_page(pdf_path, page_number)
+        try:
+            return self._extract_encoded(image_key, base64_image, retry_count, retry_delay,
+                                         max_retry_time)
+        except Exception as e:
+            if not self._is_image_too_large(e):
+                raise
+            # Re-render and let extract_table_from_image step the resolution down
+            images = self._render_pages(pdf_path, page_number, page_number)
+            return self.extract_table_from_image(images[0], retry_count, retry_delay, max_retry_time)
+    
+    def extract_table_from_image(self, image, retry_count: int = 3,
+                                 retry_delay: float = 0.5,
+                                 max_retry_time: float = 120.0,
+                                 cache_dir: Optional[str] = None) -> Tuple[pd.DataFrame, float]:
+        """
+        Extract a table from an already-rendered page image using Claude.
+        
+        Args:
+            image: PIL Image of the page
+            retry_count: Number of times to retry on failure
+            retry_delay: Base delay in seconds for exponential backoff between retries
+            max_retry_time: Maximum total time in seconds to spend retrying
+            cache_dir: Directory of content-hashed page extractions to reuse, or None to disable
+            
+        Returns:
+            Tuple of (DataFrame containing the extracted table, confidence score)
+        """
+        while True:
+            image_key, base64_image = self._encode_page(self._image_bytes(image))
+            try:
+                return self._extract_deduplicated(image_key, base64_image, retry_count, retry_delay,
+                                                  max_retry_time, cache_dir)
+            except Exception as e:
+                image = self._halve_oversized_image(image, e)
+    
+    def _extract_deduplicated(self, image_key: str, base64_image: str, retry_count: int,
+                              retry_delay: float, max_retry_time: float,
+                              cache_dir: Optional[str]) -> Tuple[pd.DataFrame, float]:
+        """
+        Extract an encoded page image, sharing the result with identical pages of the document.
+        
+        The first caller for an image makes the API call; concurrent or later
+        callers with the same image wait for and copy its result.
+        
+        Args:
+            image_key: Content hash of the page image, from _encode_page
+            base64_image: Base64 encoded image of the page
+            retry_count: Number of times to retry on failure
+            retry_delay: Base delay in seconds for exponential backoff between retries
+            max_retry_time: Maximum total time in seconds to spend retrying
+            cache_dir: Directory of content-hashed page extractions to reuse, or None to disable
+            
+        Returns:
+            Tuple of (DataFrame containing the extracted table, confidence score)
+        """
+        with self._page_futures_lock:
+            future = self._page_futures.get(image_key)
+            owner = future is None
+            if owner:
+                future = self._page_futures[image_key] = concurrent.futures.Future()
+        
+        if not owner:
+            print("Page is identical to an earlier page, reusing its extraction")
+            df, confidence = future.result()
+            return df.copy(), confidence
         
         try:
-            # Encode the image
-            base64_image = self._encode_image(image_path)
+            result = self._extract_encoded(image_key, base64_image, retry_count, retry_delay,
+                                           max_retry_time, cache_dir)
+        except Exception as e:
+            # Let later duplicates try again rather than inherit the failure
+            with self._page_futures_lock:
+                del self._page_futures[image_key]
+            future.set_exception(e)
+            raise
+        
+        future.set_result(result)
+        return result
+    
+    def _is_image_too_large(self, error: Exception) -> bool:
+        """
+        Check whether the API rejected a request because the image is too large.
+        
+        Args:
+            error: Exception raised by the request
+            
+        Returns:
+            True if the image exceeded the API's size or dimension limits
+        """
+        if not isinstance(error, anthropic.BadRequestError):
+            return False
+        message = str(error).lower()
+        return 'image' in message and ('too large' in message or 'exceed' in message)
+    
+    def _halve_oversized_image(self, image, error: Exception):
+        """
+        Halve the resolution of an image the API rejected as too large.
+        
+        Args:
+            image: PIL Image that was sent
+            error: Exception raised by the request
+            
+        Returns:
+            The image downscaled by half in each dimension
+            
+        Raises:
+            The original error if it was not about image size, or the image is already small
+        """
+        if not self._is_image_too_large(error) or min(image.size) < 2 * MIN_IMAGE_SIDE:
+            raise error
+        print(f"Image too large ({image.size[0]}x{image.size[1]}), retrying at half resolution...")
+        return image.reduce(2)
+    
+    def _extract_encoded(self, image_key: str, base64_image: str, retry_count: int = 3,
+                         retry_delay: float = 0.5, max_retry_time: float = 120.0,
+                         cache_dir: Optional[str] = None) -> Tuple[pd.DataFrame, float]:
+        """
+        Extract a table from an encoded page image using Claude.
+        
+        Args:
+            image_key: Content hash of the page image, from _encode_page
+            base64_image: Base64 encoded image of the page
+            retry_count: Number of times to retry on failure
+            retry_delay: Base delay in seconds for exponential backoff between retries
+            max_retry_time: Maximum total time in seconds to spend retrying
+            cache_dir: Directory of content-hashed page extractions to reuse, or None to disable
             
-            # Make multiple attempts in case of API errors
-            best_df = pd.DataFrame()
-            best_confidence = 0.0
+        Returns:
+            Tuple of (DataFrame containing the extracted table, confidence score)
+        """
+        # Identical page images reuse a cached extraction instead of calling the API
+        cache_path, cached = self._lookup_page_cache(cache_dir, image_key)
+        if cached is not None:
+            return cached
+        
+        # Make multiple attempts in case of API errors
+        best = (pd.DataFrame(), 0.0, None)
+        deadline = time.monotonic() + max_retry_time
+        
+        for attempt in range(retry_count):
+            try:
+                # Create the message to Claude with the image
+                if self.rate_limiter:
+                    self.rate_limiter.acquire()
+                message = self.client.messages.create(**self._build_message_kwargs(base64_image))
+                best, sleep_for = self._score_attempt(message.content[0].text, best, attempt,
+                                                      retry_count, retry_delay, deadline)
+            except Exception as api_error:
+                sleep_for = self._error_retry_delay(api_error, attempt, retry_count, retry_delay, deadline)
             
-            for attempt in range(retry_count):
+            if sleep_for is None:
+                break
+            time.sleep(sleep_for)
+        
+        return self._complete_extraction(best, cache_path)
+    
+    def _lookup_page_cache(self, cache_dir: Optional[str],
+                           image_key: str) -> Tuple[Optional[str], Optional[Tuple[pd.DataFrame, float]]]:
+        """
+        Find the page cache entry for an encoded page image.
+        
+        Args:
+            cache_dir: Directory of content-hashed page extractions to reuse, or None to disable
+            image_key: Content hash of the page image, from _encode_page
+            
+        Returns:
+            Tuple of (cache file path or None, cached (DataFrame, confidence) or None)
+        """
+        if not cache_dir:
+            return None, None
+        cache_path = self._page_cache_path(cache_dir, image_key)
+        return cache_path, self._read_page_cache(cache_path)
+    
+    def _score_attempt(self, csv_text: str, best: Tuple[pd.DataFrame, float, Optional[str]],
+                       attempt: int, retry_count: int, retry_delay: float,
+                       deadline: float) -> Tuple[Tuple[pd.DataFrame, float, Optional[str]], Optional[float]]:
+        """
+        Parse one response and decide whether another attempt is worthwhile.
+        
+        Args:
+            csv_text: Raw response text from Claude
+            best: (DataFrame, confidence, CSV text) of the best attempt so far
+            attempt: Zero-based index of this attempt
+            retry_count: Number of attempts allowed
+            retry_delay: Base delay in seconds for exponential backoff between retries
+            deadline: time.monotonic() value after which no further attempt may start
+            
+        Returns:
+            Tuple of (updated best attempt, seconds to wait before the next attempt,
+            or None to stop)
+        """
+        df, confidence = self._parse_csv_with_confidence(csv_text)
+        if confidence > best[1] and not df.empty:
+            best = (df, confidence, csv_text)
+        
+        # If we got a good result, no need to retry
+        if confidence > 0.9:
+            return best, None
+        
+        # If we have a usable result but not perfect, back off before the next attempt
+        if confidence > 0.5 and attempt < retry_count - 1:
+            sleep_for = self._backoff_delay(attempt, retry_delay)
+            if time.monotonic() + sleep_for > deadline:
+                return best, None
+            print(f"Got usable result (confidence {confidence:.2f}), but trying again for better quality...")
+            return best, sleep_for
+        
+        return best, 0.0
+    
+    def _error_retry_delay(self, error: Exception, attempt: int, retry_count: int,
+                           retry_delay: float, deadline: float) -> float:
+        """
+        Decide how to handle a failed attempt.
+        
+        Args:
+            error: Exception raised by the attempt
+            attempt: Zero-based index of the attempt
+            retry_count: Number of attempts allowed
+            retry_delay: Base delay in seconds for exponential backoff between retries
+            deadline: time.monotonic() value after which no further attempt may start
+            
+        Returns:
+            Seconds to wait before retrying
+            
+        Raises:
+            The error itself if it is not retryable or no attempts or time are left
+        """
+        sleep_for = self._backoff_delay(attempt, retry_delay, error)
+        if (attempt < retry_count - 1 and self._is_retryable(error)
+                and time.monotonic() + sleep_for <= deadline):
+            print(f"Attempt {attempt + 1} failed: {str(error)}. Retrying in {sleep_for:.1f} seconds...")
+            return sleep_for
+        raise error
+    
+    def _complete_extraction(self, best: Tuple[pd.DataFrame, float, Optional[str]],
+                             cache_path: Optional[str]) -> Tuple[pd.DataFrame, float]:
+        """
+        Finalize the best attempt and store it in the page cache.
+        
+        Args:
+            best: (DataFrame, confidence, CSV text) of the best attempt
+            cache_path: Page cache file from _lookup_page_cache, or None
+            
+        Returns:
+            Tuple of (DataFrame containing the extracted table, confidence score)
+        """
+        best_df, best_confidence, best_text = best
+        result = self._finalize_extraction(best_df, best_confidence)
+        if cache_path:
+            self._write_page_cache(cache_path, best_text, best_confidence)
+        return result
+    
+    def _is_retryable(self, error: Exception) -> bool:
+        """
+        Decide whether a failed attempt is worth retrying.
+        
+        API errors are retried only for rate limits (429) and server errors
+        (5xx); other client errors such as bad requests fail immediately.
+        
+        Args:
+            error: Exception raised by the attempt
+            
+        Returns:
+            True if the request should be retried
+        """
+        if isinstance(error, anthropic.APIStatusError):
+            return error.status_code == 429 or error.status_code >= 500
+        return True
+    
+    def _backoff_delay(self, attempt: int, base_delay: float,
+                       error: Optional[Exception] = None) -> float:
+        """
+        Compute how long to wait before the next attempt.
+        
+        Uses exponential backoff with jitter, honoring the Retry-After header
+        when the API reports a rate limit.
+        
+        Args:
+            attempt: Zero-based index of the attempt that just finished
+            base_delay: Base delay in seconds
+            error: Exception raised by the attempt, if any
+            
+        Returns:
+            Delay in seconds
+        """
+        sleep_for = min(30, (2 ** attempt) * base_delay) * random.uniform(0.75, 1.25)
+        
+        if isinstance(error, anthropic.RateLimitError):
+            retry_after = error.response.headers.get('retry-after')
+            if retry_after is not None:
                 try:
-                    # Create the message to Claude with the image
-                    message = self.client.messages.create(
-                        model="claude-3-7-sonnet-20250219",
-                        max_tokens=4000,
-                        temperature=0.2,  # Lower temperature for more consistent extraction
-                        messages=[
-                            {
-                                "role": "user",
-                                "content": [
-                                    {
-                                        "type": "text",
-                                        "text": """This image contains a table with postal clerk data. Extract all data into CSV format with these columns: Name, Where born, Whence appointed, Post-office, Compensation per annum, State, Postmaster (1 for yes, 0 for no).
-
-                                                    Important formatting instructions:
-                                                        1. Keep suffixes like Jr., Sr., or III as part of the Name field - don't let these shift data into other columns
-                                                        2. For compensation values:
-                                                            - VERY IMPORTANT: Remove any commas from dollar amounts (e.g., '$1,000.00' should be '$1000.00')
-                                                            - Remove any spaces between dollars and cents and account for the decimal (e.g., '$100 00' should be '$100.00')
-                                                            - Pay special attention to monetary amounts, ensuring the correct number of zeros
-                                                            - Look carefully at each digit in salary amounts to avoid misreading
-                                                            - Standardize monetary values to a consistent format
-                                                        3. When a cell contains 'do', it means 'ditto' - repeating the value from the previous row in that column
-                                                        4. For entries with 'p.m.' in the compensation column, make sure you put 1 in the Postmaster column. Otherwise Postmaster is 0.
-                                                        5. If any field might contain a comma (especially in monetary values), ensure it's properly quoted
-                                                        6. If on any given page a new table starts with a new table heading, ignore it and do not add the data
-
-                                                    Only respond with the raw CSV data, no explanations or markdown formatting."""
-                                    },
-                                    {
-                                        "type": "image",
-                                        "source": {
-                                            "type": "base64",
-                                            "media_type": "image/png",
-                                            "data": base64_image
-                                        }
-                                    }
-                                ]
-                            }
-                        ]
-                    )
-                    
-                    # Get Claude's response
-                    csv_text = message.content[0].text
-                    
-                    # Parse the CSV data with confidence score
-                    df, confidence = self._parse_csv_with_confidence(csv_text)
-                    
-                    if confidence > best_confidence and not df.empty:
-                        best_df = df
-                        best_confidence = confidence
-                    
-                    # If we got a good result, no need to retry
-                    if confidence > 0.9:
-                        break
-                    
-                    # If we have a usable result but not perfect, continue to next attempt
-                    if confidence > 0.5 and attempt < retry_count - 1:
-                        print(f"Got usable result (confidence {confidence:.2f}), but trying again for better quality...")
-                        time.sleep(retry_delay)
-                        continue
-                        
-                except Exception as api_error:
-                    if attempt < retry_count - 1:
-                        print(f"Attempt {attempt + 1} failed: {str(api_error)}. Retrying in {retry_delay} seconds...")
-                        time.sleep(retry_delay)
-                    else:
-                        raise api_error
+                    sleep_for = float(retry_after)
+                except ValueError:
+                    pass
+        
+        return sleep_for
+    
+    def _apply_table_rules(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Apply the register's cell conventions to a raw extracted table.
+        
+        Resolves 'do' (ditto) cells to the value above, blanks out dotted
+        leader cells, and derives the Postmaster flag from 'p.m.' markers.
+        
+        Args:
+            df: Raw table as parsed from Claude's CSV
             
-            if best_df.empty:
-                raise Exception("Failed to extract any usable data after multiple attempts")
-                
-            # Post-process the data to clean up salaries and add a cleaned salary column
-            if 'Compensation per annum' in best_df.columns:
-                best_df['salary_clean'] = best_df['Compensation per annum'].apply(self._clean_salary_value)
+        Returns:
+            DataFrame with the rules applied
+        """
+        text_cols = df.select_dtypes(include='object').columns
+        if len(text_cols) > 0:
+            text = df[text_cols]
             
-            return best_df, best_confidence
+            # Fill 'do' cells from the nearest value above in the same column
+            is_do = text.apply(lambda col: col.str.strip().str.lower() == 'do')
+            text = text.where(~is_do, text.mask(is_do).ffill())
             
-        finally:
-            # Clean up the temporary image file
-            if os.path.exists(image_path):
-                os.remove(image_path)
+            # Dotted leader lines mean the cell is empty
+            df[text_cols] = text.replace(r'^\s*\.{2,}\s*$', pd.NA, regex=True)
+        
+        if 'Compensation per annum' in df.columns:
+            comp = df['Compensation per annum'].astype('string')
+            df['Postmaster'] = comp.str.contains(r'p\.\s*m\.', regex=True, na=False).astype('int8')
+        
+        return df
+    
+    def _finalize_extraction(self, best_df: pd.DataFrame,
+                             best_confidence: float) -> Tuple[pd.DataFrame, float]:
+        """
+        Validate the best extraction attempt and add derived columns.
+        
+        Args:
+            best_df: DataFrame from the highest-confidence attempt
+            best_confidence: Confidence score of that attempt
+            
+        Returns:
+            Tuple of (DataFrame containing the extracted table, confidence score)
+        """
+        if best_df.empty:
+            raise Exception("Failed to extract any usable data after multiple attempts")
+        
+        best_df = self._apply_table_rules(best_df)
+            
+        # Post-process the data to clean up salaries and add a cleaned salary column
+        if 'Compensation per annum' in best_df.columns:
+            best_df['salary_clean'] = best_df['Compensation per annum'].apply(self._clean_salary_value)
+        
+        return best_df, best_confidence
+    
+    def _process_page(self, image, page_num: int, total_pages: int, output_dir: str,
+                      file_base: str, source_stamp: Dict[bytes, bytes]) -> Tuple[pd.DataFrame, float]:
+        """
+        Extract the table from one rendered page and save the per-page outputs.
+        
+        Args:
+            image: PIL Image of the page
+            page_num: Page number (1-indexed)
+            total_pages: Total number of pages in the PDF
+            output_dir: Directory to save the CSV files
+            file_base: Base name used for output files
+            source_stamp: Fingerprint of the source PDF, as returned by _source_stamp
+            
+        Returns:
+            Tuple of (DataFrame, confidence) for the page
+        """
+        print(f"Processing page {page_num} of {total_pages}...")
+        try:
+            df, confidence = self.extract_table_from_image(
+                image, cache_dir=os.path.join(output_dir, PAGE_CACHE_DIRNAME)
+            )
+            self._store_resumed_page(self._resume_path(output_dir, file_base, page_num), df, confidence,
+                                     source_stamp)
+        except Exception as e:
+            return self._save_page_error(page_num, e, output_dir, file_base)
+        return self._save_page_result(df, confidence, page_num, output_dir, file_base)
+    
+    def _save_page_result(self, df: pd.DataFrame, confidence: float, page_num: int,
+                          output_dir: str, file_base: str) -> Tuple[pd.DataFrame, float]:
+        """
+        Save the extracted table and metadata for one page, if per-page output is enabled.
+        
+        Args:
+            df: Extracted table for the page
+            confidence: Confidence score of the extraction
+            page_num: Page number (1-indexed)
+            output_dir: Directory to save the CSV files
+            file_base: Base name used for output files
+            
+        Returns:
+            Tuple of (DataFrame, confidence) for the page
+        """
+        if not self.per_page_csv:
+            print(f"Extracted page {page_num} (confidence: {confidence:.2f})")
+            return df, confidence
+        
+        # Save individual page result
+        output_path = os.path.join(output_dir, f"{file_base}_page_{page_num}.csv")
+        df.to_csv(output_path, index=False)
+        print(f"Saved extracted table to {output_path} (confidence: {confidence:.2f})")
+        
+        # Also save a metadata file with the confidence score
+        meta_path = os.path.join(output_dir, f"{file_base}_page_{page_num}_meta.json")
+        meta = {
+            'page': page_num,
+            'confidence': float(confidence),
+            'rows': len(df),
+            'columns': len(df.columns)
+        }
+        with open(meta_path, 'wb') as f:
+            f.write(orjson.dumps(meta) if orjson else json.dumps(meta).encode())
+        
+        return df, confidence
+    
+    def _save_page_error(self, page_num: int, error: Exception,
+                         output_dir: str, file_base: str) -> Tuple[pd.DataFrame, float]:
+        """
+        Save an empty placeholder for a page whose extraction failed, if per-page output is enabled.
+        
+        Args:
+            page_num: Page number (1-indexed)
+            error: Exception raised during extraction
+            output_dir: Directory to save the CSV files
+            file_base: Base name used for output files
+            
+        Returns:
+            Tuple of (empty DataFrame, 0.0)
+        """
+        print(f"Error processing page {page_num}: {str(error)}")
+        # Create an empty DataFrame with the expected structure to maintain continuity
+        empty_df = pd.DataFrame(columns=['Name', 'Where born', 'Whence appointed', 
+                                        'Post-office', 'Compensation per annum', 
+                                        'State', 'Postmaster', 'extraction_confidence'])
+        
+        if not self.per_page_csv:
+            return empty_df, 0.0
+        
+        # Save the empty DataFrame to maintain file sequence
+        output_path = os.path.join(output_dir, f"{file_base}_page_{page_num}_error.csv")
+        empty_df.to_csv(output_path, index=False)
+        print(f"Saved empty placeholder for page {page_num} due to error")
+        
+        return empty_df, 0.0
     
     def process_pdf_document(self, pdf_path: str, output_dir: str = ".",
-                             start_page: int = 1, end_page: Optional[int] = None) -> List[Tuple[pd.DataFrame, float]]:
+                             start_page: int = 1, end_page: Optional[int] = None,
+                             render_chunk_size: int = 10, max_workers: int = 1,
+                             render_queue_size: int = 4) -> List[Tuple[pd.DataFrame, float]]:
         """
         Process multiple pages of a PDF document and extract tables.
         
+        A background thread renders pages ahead into a bounded queue while
+        up to max_workers threads send rendered pages to Claude, so Poppler
+        rendering overlaps with API latency.
+        
         Args:
             pdf_path: Path to the PDF file
             output_dir: Directory to save the CSV files
             start_page: First page to process (1-indexed)
             end_page: Last page to process (inclusive), or None to process till the end
+            render_chunk_size: Number of pages to rasterize per Poppler call
+            max_workers: Maximum number of pages sent to Claude concurrently
+            render_queue_size: Maximum number of rendered pages waiting for a worker
             
         Returns:
             List of tuples (DataFrame, confidence), one per page
@@ -329,72 +1223,386 @@ class TableExtractor:
         # Get file basename for output files
         file_base = os.path.splitext(os.path.basename(pdf_path))[0]
         
-        # Get total number of pages in PDF
-        images = convert_from_path(pdf_path, first_page=1, last_page=1)
-        total_pages = len(convert_from_path(pdf_path, first_page=1, last_page=None))
+        # Get total number of pages in PDF without rendering it
+        total_pages = self._page_count(pdf_path)
         
         if end_page is None or end_page > total_pages:
             end_page = total_pages
         
-        results = []
-        for page_num in range(start_page, end_page + 1):
-            print(f"Processing page {page_num} of {total_pages}...")
+        # Pages confidently extracted by a previous run are not rendered or sent again
+        source_stamp = self._source_stamp(pdf_path)
+        resumed = self._load_resumed_pages(output_dir, file_base, start_page, end_page, source_stamp)
+        self._page_futures = {}
+        
+        # Producer: render pages ahead of the API calls; the queue bound provides backpressure
+        rendered = queue.Queue(maxsize=render_queue_size)
+        stop_rendering = threading.Event()
+        
+        def put(item):
+            # Give up if the consumer has stopped, so the producer never blocks forever
+            while not stop_rendering.is_set():
+                try:
+                    rendered.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+        
+        def render_pages():
             try:
-                df, confidence = self.extract_table_from_pdf_page(pdf_path, page_num)
-                results.append((df, confidence))
-                
-                # Save individual page result
-                output_path = os.path.join(output_dir, f"{file_base}_page_{page_num}.csv")
-                df.to_csv(output_path, index=False)
-                print(f"Saved extracted table to {output_path} (confidence: {confidence:.2f})")
+                for chunk_start in range(start_page, end_page + 1, render_chunk_size):
+                    # Render a bounded chunk of pages with a single Poppler invocation
+                    chunk_end = min(chunk_start + render_chunk_size - 1, end_page)
+                    todo = [n for n in range(chunk_start, chunk_end + 1) if n not in resumed]
+                    if not todo:
+                        continue
+                    images = self._render_pages(pdf_path, todo[0], todo[-1])
+                    for page_num, image in enumerate(images, start=todo[0]):
+                        if page_num not in resumed:
+                            put((page_num, image))
+            except Exception as e:
+                put(e)
+            finally:
+                put(None)
+        
+        page_results = dict(resumed)
+        next_page = start_page
+        in_flight = {}
+        
+        with CombinedTableWriter(output_dir, file_base) as combined, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=1) as render_pool, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as api_pool:
+            render_pool.submit(render_pages)
+            
+            def collect(return_when):
+                nonlocal next_page
+                done, _ = concurrent.futures.wait(in_flight, return_when=return_when)
+                for future in done:
+                    page_results[in_flight.pop(future)] = future.result()
                 
-                # Also save a metadata file with the confidence score
-                meta_path = os.path.join(output_dir, f"{file_base}_page_{page_num}_meta.json")
-                pd.Series({
-                    'page': page_num,
-                    'confidence': confidence,
-                    'rows': len(df),
-                    'columns': len(df.columns)
-                }).to_json(meta_path)
+                # Append to the combined files in page order
+                while next_page in page_results:
+                    combined.write(*page_results[next_page])
+                    next_page += 1
+            
+            # Consumer: hand rendered pages to the API workers
+            try:
+                while True:
+                    item = rendered.get()
+                    if item is None:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    
+                    page_num, image = item
+                    future = api_pool.submit(self._process_page, image, page_num, total_pages,
+                                             output_dir, file_base, source_stamp)
+                    in_flight[future] = page_num
+                    
+                    if len(in_flight) >= max_workers:
+                        collect(concurrent.futures.FIRST_COMPLETED)
                 
+                collect(concurrent.futures.ALL_COMPLETED)
+            finally:
+                stop_rendering.set()
+        
+        return [page_results[page_num] for page_num in sorted(page_results)]
+
+
+class AsyncTableExtractor(TableExtractor):
+    def __init__(self, api_key: Optional[str] = None, dpi: int = 200, per_page_csv: bool = False,
+                 rps_limit: Optional[float] = None, use_pymupdf: bool = True,
+                 image_format: str = 'jpeg', max_concurrency: int = 8):
+        """
+        Initialize an extractor that issues page requests to Claude concurrently.
+        
+        Args:
+            api_key: Anthropic API key. If None, it will try to get it from the environment variable.
+            dpi: Resolution used when rasterizing PDF pages
+            per_page_csv: Also write a CSV and metadata file for every page
+            rps_limit: Maximum API requests started per second, or None for no limit
+            use_pymupdf: Render pages with PyMuPDF when it is installed instead of Poppler
+            image_format: Encoding of page images sent to Claude ('jpeg' or 'png')
+            max_concurrency: Maximum number of in-flight API requests
+        """
+        super().__init__(api_key=api_key, dpi=dpi, per_page_csv=per_page_csv, rps_limit=rps_limit,
+                         use_pymupdf=use_pymupdf, image_format=image_format)
+        self.max_concurrency = max_concurrency
+    
+    def _create_client(self):
+        """
+        Create the asynchronous Anthropic client used for API requests.
+        
+        Returns:
+            An AsyncAnthropic client instance
+        """
+        # Async clients are bound to an event loop, so each extractor gets its own pool
+        http_client = anthropic.DefaultAsyncHttpxClient(limits=HTTP_POOL_LIMITS, http2=HTTP2_AVAILABLE)
+        return anthropic.AsyncAnthropic(api_key=self.api_key, http_client=http_client)
+    
+    async def extract_table_from_pdf_page(self, pdf_path: str, page_number: int,
+                                          retry_count: int = 3, retry_delay: float = 0.5,
+                            max_retry_time: float = 120.0) -> Tuple[pd.DataFrame, float]:
+        """
+        Extract a table from a specific page of a PDF using Claude.
+        
+        Args:
+            pdf_path: Path to the PDF file
+            page_number: Page number to extract (1-indexed)
+            retry_count: Number of times to retry on failure
+            retry_delay: Base delay in seconds for exponential backoff between retries
+            max_retry_time: Maximum total time in seconds to spend retrying
+            
+        Returns:
+            Tuple of (DataFrame containing the extracted table, confidence score)
+        """
+        image_key, base64_image = await asyncio.to_thread(self._encode_pdf_page, pdf_path, page_number)
+        try:
+            return await self._extract_encoded(image_key, base64_image, retry_count, retry_delay,
+                                               max_retry_time)
+        except Exception as e:
+            if not self._is_image_too_large(e):
+                raise
+            images = await asyncio.to_thread(self._render_pages, pdf_path, page_number, page_number)
+            return await self.extract_table_from_image(images[0], retry_count, retry_delay, max_retry_time)
+    
+    async def extract_table_from_image(self, image, retry_count: int = 3,
+                                       retry_delay: float = 0.5,
+                                       max_retry_time: float = 120.0,
+                                       cache_dir: Optional[str] = None) -> Tuple[pd.DataFrame, float]:
+        """
+        Extract a table from an already-rendered page image using Claude.
+        
+        Args:
+            image: PIL Image of the page
+            retry_count: Number of times to retry on failure
+            retry_delay: Base delay in seconds for exponential backoff between retries
+            max_retry_time: Maximum total time in seconds to spend retrying
+            cache_dir: Directory of content-hashed page extractions to reuse, or None to disable
+            
+        Returns:
+            Tuple of (DataFrame containing the extracted table, confidence score)
+        """
+        while True:
+            # Image encoding is CPU-bound, so keep it off the event loop
+            image_bytes = await asyncio.to_thread(self._image_bytes, image)
+            image_key, base64_image = self._encode_page(image_bytes)
+            try:
+                return await self._extract_deduplicated(image_key, base64_image, retry_count,
+                                                        retry_delay, max_retry_time, cache_dir)
             except Exception as e:
-                print(f"Error processing page {page_num}: {str(e)}")
-                # Create an empty DataFrame with the expected structure to maintain continuity
-                empty_df = pd.DataFrame(columns=['Name', 'Where born', 'Whence appointed', 
-                                                'Post-office', 'Compensation per annum', 
-                                                'State', 'Postmaster', 'extraction_confidence'])
-                results.append((empty_df, 0.0))
-                
-                # Save the empty DataFrame to maintain file sequence
-                output_path = os.path.join(output_dir, f"{file_base}_page_{page_num}_error.csv")
-                empty_df.to_csv(output_path, index=False)
-                print(f"Saved empty placeholder for page {page_num} due to error")
-        
-        # Save combined results if we have any
-        valid_results = [(df, conf) for df, conf in results if not df.empty]
-        if valid_results:
-            # Extract just the DataFrames for combining
-            valid_dfs = [df for df, _ in valid_results]
-            
-            # Check if all DataFrames have similar columns (ignoring extraction_confidence)
-            base_cols = set(valid_dfs[0].columns) - {'extraction_confidence'}
-            if all(set(df.columns) - {'extraction_confidence'} == base_cols for df in valid_dfs):
-                # Combine the DataFrames
-                combined_df = pd.concat(valid_dfs, ignore_index=True)
-                combined_path = os.path.join(output_dir, f"{file_base}_combined.csv")
-                combined_df.to_csv(combined_path, index=False)
-                print(f"Saved combined table to {combined_path}")
+                image = self._halve_oversized_image(image, e)
+    
+    async def _extract_deduplicated(self, image_key: str, base64_image: str, retry_count: int,
+                                    retry_delay: float, max_retry_time: float,
+                                    cache_dir: Optional[str]) -> Tuple[pd.DataFrame, float]:
+        """
+        Extract an encoded page image, sharing the result with identical pages of the document.
+        
+        Args:
+            image_key: Content hash of the page image, from _encode_page
+            base64_image: Base64 encoded image of the page
+            retry_count: Number of times to retry on failure
+            retry_delay: Base delay in seconds for exponential backoff between retries
+            max_retry_time: Maximum total time in seconds to spend retrying
+            cache_dir: Directory of content-hashed page extractions to reuse, or None to disable
+            
+        Returns:
+            Tuple of (DataFrame containing the extracted table, confidence score)
+        """
+        # Everything runs on one event loop, so no lock is needed around the dict
+        future = self._page_futures.get(image_key)
+        if future is not None:
+            print("Page is identical to an earlier page, reusing its extraction")
+            df, confidence = await asyncio.shield(future)
+            return df.copy(), confidence
+        
+        future = self._page_futures[image_key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._extract_encoded(image_key, base64_image, retry_count, retry_delay,
+                                                 max_retry_time, cache_dir)
+        except Exception as e:
+            del self._page_futures[image_key]
+            future.set_exception(e)
+            # Mark the exception retrieved in case no duplicate is waiting on it
+            future.exception()
+            raise
+        
+        future.set_result(result)
+        return result
+    
+    async def _extract_encoded(self, image_key: str, base64_image: str, retry_count: int = 3,
+                               retry_delay: float = 0.5, max_retry_time: float = 120.0,
+                               cache_dir: Optional[str] = None) -> Tuple[pd.DataFrame, float]:
+        """
+        Extract a table from an encoded page image using Claude.
+        
+        Args:
+            image_key: Content hash of the page image, from _encode_page
+            base64_image: Base64 encoded image of the page
+            retry_count: Number of times to retry on failure
+            retry_delay: Base delay in seconds for exponential backoff between retries
+            max_retry_time: Maximum total time in seconds to spend retrying
+            cache_dir: Directory of content-hashed page extractions to reuse, or None to disable
+            
+        Returns:
+            Tuple of (DataFrame containing the extracted table, confidence score)
+        """
+        cache_path, cached = self._lookup_page_cache(cache_dir, image_key)
+        if cached is not None:
+            return cached
+        
+        best = (pd.DataFrame(), 0.0, None)
+        deadline = time.monotonic() + max_retry_time
+        
+        for attempt in range(retry_count):
+            try:
+                if self.rate_limiter:
+                    await asyncio.to_thread(self.rate_limiter.acquire)
+                message = await self.client.messages.create(**self._build_message_kwargs(base64_image))
+                best, sleep_for = self._score_attempt(message.content[0].text, best, attempt,
+                                                      retry_count, retry_delay, deadline)
+            except Exception as api_error:
+                sleep_for = self._error_retry_delay(api_error, attempt, retry_count, retry_delay, deadline)
+            
+            if sleep_for is None:
+                break
+            await asyncio.sleep(sleep_for)
+        
+        return self._complete_extraction(best, cache_path)
+    
+    def process_pdf_document(self, pdf_path: str, output_dir: str = ".",
+                             start_page: int = 1, end_page: Optional[int] = None,
+                             render_chunk_size: int = 10) -> List[Tuple[pd.DataFrame, float]]:
+        """
+        Process multiple pages of a PDF document, extracting pages concurrently.
+        
+        Args:
+            pdf_path: Path to the PDF file
+            output_dir: Directory to save the CSV files
+            start_page: First page to process (1-indexed)
+            end_page: Last page to process (inclusive), or None to process till the end
+            render_chunk_size: Number of pages to rasterize per Poppler call
+            
+        Returns:
+            List of tuples (DataFrame, confidence), one per page
+        """
+        return asyncio.run(self.process_pdf_document_async(
+            pdf_path, output_dir, start_page, end_page, render_chunk_size
+        ))
+    
+    async def process_pdf_document_async(self, pdf_path: str, output_dir: str = ".",
+                                         start_page: int = 1, end_page: Optional[int] = None,
+                                         render_chunk_size: int = 10) -> List[Tuple[pd.DataFrame, float]]:
+        """
+        Asynchronously process multiple pages of a PDF document.
+        
+        A concurrency slot is taken for each page before it is rendered and
+        released once its extraction finishes, so at most max_concurrency
+        pages are rendered or in flight at a time. Rendering runs alongside
+        the extractions, and each page is written to disk as soon as its
+        extraction finishes.
+        
+        Args:
+            pdf_path: Path to the PDF file
+            output_dir: Directory to save the CSV files
+            start_page: First page to process (1-indexed)
+            end_page: Last page to process (inclusive), or None to process till the end
+            render_chunk_size: Number of pages to rasterize per Poppler call (at most max_concurrency)
+            
+        Returns:
+            List of tuples (DataFrame, confidence), one per page
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        file_base = os.path.splitext(os.path.basename(pdf_path))[0]
+        
+        total_pages = await asyncio.to_thread(self._page_count, pdf_path)
+        if end_page is None or end_page > total_pages:
+            end_page = total_pages
+        
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        cache_dir = os.path.join(output_dir, PAGE_CACHE_DIRNAME)
+        source_stamp = self._source_stamp(pdf_path)
+        resumed = self._load_resumed_pages(output_dir, file_base, start_page, end_page, source_stamp)
+        todo = [n for n in range(start_page, end_page + 1) if n not in resumed]
+        self._page_futures = {}
+        
+        # Finished pages as (page_num, df, confidence, error), or an exception from rendering
+        finished = asyncio.Queue()
+        tasks = set()
+        
+        async def extract(image, page_num):
+            # The caller acquired this page's semaphore slot before rendering it
+            try:
+                print(f"Processing page {page_num} of {total_pages}...")
+                try:
+                    df, confidence = await self.extract_table_from_image(image, cache_dir=cache_dir)
+                    self._store_resumed_page(self._resume_path(output_dir, file_base, page_num), df, confidence,
+                                             source_stamp)
+                except Exception as e:
+                    finished.put_nowait((page_num, None, 0.0, e))
+                    return
+                finished.put_nowait((page_num, df, confidence, None))
+            finally:
+                semaphore.release()
+        
+        async def render():
+            # A chunk larger than the semaphore could never acquire all its slots
+            chunk_size = max(1, min(render_chunk_size, self.max_concurrency))
+            try:
+                for i in range(0, len(todo), chunk_size):
+                    chunk = todo[i:i + chunk_size]
+                    for _ in chunk:
+                        await semaphore.acquire()
+                    images = await asyncio.to_thread(self._render_pages, pdf_path, chunk[0], chunk[-1])
+                    page_images = dict(zip(range(chunk[0], chunk[-1] + 1), images))
+                    for page_num in chunk:
+                        image = page_images.get(page_num)
+                        if image is None:
+                            semaphore.release()
+                            finished.put_nowait((page_num, None, 0.0, Exception(f"Page {page_num} was not rendered")))
+                            continue
+                        task = asyncio.create_task(extract(image, page_num))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+            except Exception as e:
+                finished.put_nowait(e)
+        
+        render_task = asyncio.create_task(render())
+        
+        # Write each page as soon as it completes, appending to the combined
+        # files once every earlier page has been written
+        page_results = dict(resumed)
+        next_page = start_page
+        try:
+            with CombinedTableWriter(output_dir, file_base) as combined:
+                while next_page in page_results:
+                    combined.write(*page_results[next_page])
+                    next_page += 1
                 
-                # Also save a filtered version with only high-confidence rows
-                if 'extraction_confidence' in combined_df.columns:
-                    high_conf_df = combined_df[combined_df['extraction_confidence'] > 0.7]
-                    high_conf_path = os.path.join(output_dir, f"{file_base}_combined_high_confidence.csv")
-                    high_conf_df.to_csv(high_conf_path, index=False)
-                    print(f"Saved high-confidence rows to {high_conf_path}")
-            else:
-                print("Tables have different structures, not combining them.")
+                for _ in todo:
+                    item = await finished.get()
+                    if isinstance(item, Exception):
+                        raise item
+                    
+                    page_num, df, confidence, error = item
+                    if error is not None:
+                        page_results[page_num] = self._save_page_error(page_num, error, output_dir, file_base)
+                    else:
+                        page_results[page_num] = self._save_page_result(df, confidence, page_num,
+                                                                        output_dir, file_base)
+                    
+                    while next_page in page_results:
+                        combined.write(*page_results[next_page])
+                        next_page += 1
+        finally:
+            # Everything has finished unless rendering or writing failed; in that
+            # case stop rendering and abandon the pages still in flight
+            render_task.cancel()
+            for task in list(tasks):
+                task.cancel()
+            await asyncio.gather(render_task, *tasks, return_exceptions=True)
         
-        return results
+        return [page_results[page_num] for page_num in sorted(page_results)]
 
 
 def main():
@@ -404,16 +1612,41 @@ def main():
     parser.add_argument('--start_page', type=int, default=1, help='First page to process (1-indexed)')
     parser.add_argument('--end_page', type=int, help='Last page to process (inclusive)')
     parser.add_argument('--api_key', help='Anthropic API key (optional if set as environment variable)')
+    parser.add_argument('--dpi', type=int, default=200, help='Resolution used when rasterizing PDF pages')
+    parser.add_argument('--per-page-csv', dest='per_page_csv', action='store_true',
+                        help='Also write a CSV and metadata file for every page')
+    parser.add_argument('--concurrency', type=int, default=4, help='Number of pages to extract concurrently')
+    parser.add_argument('--rps_limit', type=float, help='Maximum API requests started per second')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Use the asyncio client instead of a thread pool')
+    parser.add_argument('--image_format', choices=IMAGE_FORMATS, default='jpeg',
+                        help='Encoding of page images sent to Claude')
+    parser.add_argument('--no-pymupdf', dest='use_pymupdf', action='store_false',
+                        help='Render pages with Poppler (pdf2image) even if PyMuPDF is installed')
     
     args = parser.parse_args()
     
-    extractor = TableExtractor(api_key=args.api_key)
-    extractor.process_pdf_document(
-        pdf_path=args.pdf_path,
-        output_dir=args.output_dir,
-        start_page=args.start_page,
-        end_page=args.end_page
-    )
+    if args.use_async:
+        extractor = AsyncTableExtractor(api_key=args.api_key, dpi=args.dpi, per_page_csv=args.per_page_csv,
+                                        rps_limit=args.rps_limit, use_pymupdf=args.use_pymupdf,
+                                        image_format=args.image_format, max_concurrency=args.concurrency)
+        extractor.process_pdf_document(
+            pdf_path=args.pdf_path,
+            output_dir=args.output_dir,
+            start_page=args.start_page,
+            end_page=args.end_page
+        )
+    else:
+        extractor = TableExtractor(api_key=args.api_key, dpi=args.dpi, per_page_csv=args.per_page_csv,
+                                   rps_limit=args.rps_limit, use_pymupdf=args.use_pymupdf,
+                                   image_format=args.image_format)
+        extractor.process_pdf_document(
+            pdf_path=args.pdf_path,
+            output_dir=args.output_dir,
+            start_page=args.start_page,
+            end_page=args.end_page,
+            max_workers=args.concurrency
+        )
 
 
 if __name__ == "__main__":
@@ -3,6 +3,10 @@
 import os
 import sys
 import logging
+import concurrent.futures
+import functools
+from collections import deque
+from itertools import islice
 from pathlib import Path
 import argparse
 
@@ -11,12 +15,18 @@ if os.path.dirname(os.path.abspath(__file__)) not in sys.path:
     sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Import from other modules
-from preprocess import preprocess_document
+from preprocess import preprocess_document, set_num_threads
 from table_detector import detect_table_structure
-from postprocess import save_to_csv
+from postprocess import save_to_csv, save_ocr_lines
 from doctr.io import DocumentFile
 from doctr.models import ocr_predictor
 
+# DocTR may be installed with the TensorFlow backend instead of PyTorch
+try:
+    import torch
+except ImportError:
+    torch = None
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -28,14 +38,74 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def process_document(input_path, output_csv, max_pages=None):
+@functools.lru_cache(maxsize=1)
+def _get_model(det_arch='db_resnet50', reco_arch='crnn_vgg16_bn', half_precision=True, use_gpu=True):
+    """
+    Load the OCR model once per process and reuse it for every document.
+    
+    On a CUDA host the model is moved to the GPU (unless use_gpu is False),
+    in FP16 unless half_precision is False.
+    
+    Args:
+        det_arch: DocTR text detection architecture
+        reco_arch: DocTR text recognition architecture
+        half_precision: Run the model in FP16 when it is placed on a GPU
+        use_gpu: Place the model on the GPU when CUDA is available
+        
+    Returns:
+        A pretrained DocTR OCR predictor
+    """
+    logger.info("Loading OCR model")
+    model = ocr_predictor(det_arch=det_arch, reco_arch=reco_arch, pretrained=True)
+    
+    if use_gpu and torch is not None and torch.cuda.is_available():
+        model = model.cuda()
+        if half_precision:
+            model = model.half()
+        logger.info(f"OCR model on GPU ({'FP16' if half_precision else 'FP32'})")
+    
+    return model
+
+def _preprocess_pages(pool, pages, window):
+    """
+    Preprocess pages on a thread pool, yielding them back in page order.
+    
+    At most window pages are submitted ahead of the consumer, so a long
+    document never has all of its preprocessed pages in memory at once.
+    
+    Args:
+        pool: Executor running preprocess_document
+        pages: Page images to preprocess
+        window: Maximum number of pages submitted but not yet consumed
+        
+    Yields:
+        Preprocessed page images
+    """
+    pending = deque()
+    for page_num, page in enumerate(pages):
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(pool.submit(preprocess_document, page, page_num))
+    while pending:
+        yield pending.popleft().result()
+
+def process_document(input_path, output_csv, max_pages=None, batch_size=8, preprocess_workers=None,
+                     half_precision=True, raw_csv=None, use_gpu=True):
     """
     Process a document using OCR and table structure detection.
     
+    Pages are preprocessed on a thread pool while the OCR model consumes
+    them in mini-batches, so OpenCV work overlaps with model inference.
+    
     Args:
         input_path: Path to the input PDF file
         output_csv: Path to save the extracted data as CSV
         max_pages: Maximum number of pages to process (None for all)
+        batch_size: Number of pages passed to the OCR model per call
+        preprocess_workers: Number of preprocessing threads (None for the CPU count)
+        half_precision: Run OCR in FP16 when a GPU is available
+        raw_csv: Optional path to also save every raw OCR text line as CSV
+        use_gpu: Run OCR on the GPU when CUDA is available
     """
     # Load the document
     logger.info(f"Loading document: {input_path}")
@@ -50,44 +120,51 @@ def process_document(input_path, output_csv, max_pages=None):
         pages_to_process = total_pages
         logger.info(f"Processing all {total_pages} pages.")
     
-    # Load OCR model
-    logger.info("Loading OCR model")
-    model = ocr_predictor(det_arch='db_resnet50', reco_arch='crnn_vgg16_bn', pretrained=True)
+    # Load OCR model (cached after the first document)
+    model = _get_model(half_precision=half_precision, use_gpu=use_gpu)
     
-    # Process each page
-    all_table_data = []
+    # Start a fresh output file; each page's rows are appended as soon as they are detected
+    open(output_csv, 'w').close()
+    total_rows = 0
     
-    for page_num in range(pages_to_process):
-        logger.info(f"Processing page {page_num+1}/{pages_to_process}")
-        
-        # Get page image and preprocess
-        page_img = doc[page_num]
-        processed_img = preprocess_document(page_img, page_num)
+    # Process pages in batches
+    with concurrent.futures.ThreadPoolExecutor(max_workers=preprocess_workers or os.cpu_count()) as pool:
+        # Preprocess pages in parallel, keeping up to two batches in flight ahead of the model
+        processed_pages = _preprocess_pages(pool, doc[:pages_to_process], 2 * batch_size)
         
-        # Perform OCR
-        logger.info(f"Running OCR on page {page_num+1}")
-        result = model([processed_img])
-        
-        # Extract table structure
-        logger.info(f"Detecting table structure on page {page_num+1}")
-        table_data = detect_table_structure(result, 0)  # 0 because we're processing one page at a time
-        
-        if table_data:
-            all_table_data.extend(table_data)
-            logger.info(f"Found {len(table_data)} table rows on page {page_num+1}")
-        else:
-            logger.warning(f"No table data detected on page {page_num+1}")
+        for batch_start in range(0, pages_to_process, batch_size):
+            batch = list(islice(processed_pages, batch_size))
+            batch_end = batch_start + len(batch)
+            
+            # Perform OCR
+            logger.info(f"Running OCR on pages {batch_start+1}-{batch_end}/{pages_to_process}")
+            result = model(batch)
+            
+            if raw_csv:
+                save_ocr_lines(result, raw_csv, first_page=batch_start, append=batch_start > 0)
+            
+            for batch_idx, page_num in enumerate(range(batch_start, batch_end)):
+                # Extract table structure
+                logger.info(f"Detecting table structure on page {page_num+1}")
+                table_data = detect_table_structure(result, batch_idx)
+                n_rows = len(table_data["State"])
+                
+                if n_rows:
+                    logger.info(f"Found {n_rows} table rows on page {page_num+1}")
+                    total_rows += save_to_csv(table_data, output_csv, append=True)
+                else:
+                    logger.warning(f"No table data detected on page {page_num+1}")
     
-    # Save results to CSV
-    logger.info(f"Saving {len(all_table_data)} total rows to {output_csv}")
-    save_to_csv(all_table_data, output_csv)
-    logger.info(f"OCR processing complete. Results saved to {output_csv}")
+    logger.info(f"OCR processing complete. Saved {total_rows} total rows to {output_csv}")
 
 def main():
     parser = argparse.ArgumentParser(description="OCR processing for historical postal service tables")
     parser.add_argument('--input', type=str, required=True, help='Path to the input PDF file')
     parser.add_argument('--output', type=str, required=True, help='Path to the output CSV file')
     parser.add_argument('--max_pages', type=int, default=None, help='Maximum number of pages to process')
+    parser.add_argument('--batch_size', type=int, default=8, help='Number of pages per OCR model call')
+    parser.add_argument('--fp32', action='store_true', help='Keep the OCR model in FP32 on GPU')
+    parser.add_argument('--raw_output', type=str, default=None, help='Optional CSV path for the raw OCR text lines')
     args = parser.parse_args()
     
     # Ensure output directory exists
@@ -95,8 +172,12 @@ def main():
     if output_dir:
         os.makedirs(output_dir, exist_ok=True)
     
+    # A single document in this process, so OpenCV may use every core
+    set_num_threads()
+    
     # Process the document
-    process_document(args.input, args.output, args.max_pages)
+    process_document(args.input, args.output, args.max_pages, args.batch_size,
+                     half_precision=not args.fp32, raw_csv=args.raw_output)
 
 if __name__ == "__main__":
     main()
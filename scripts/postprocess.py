@@ -1,60 +1,171 @@
+import csv
+import os
+import numpy as np
 import pandas as pd
 import re
 import logging
 
+from table_detector import flatten_page_words
+
+# Optional: Arrow's multithreaded CSV reader/writer (falls back to pandas)
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = pacsv = None
+
+# concat_tables(promote_options=...) needs pyarrow 14; older versions use the pandas paths
+if pa is not None and int(pa.__version__.split('.')[0]) < 14:
+    pa = pacsv = None
+
+# Arrow quotes every string value and header name ("needed"), where pandas quotes only
+# fields containing a delimiter, quote or newline. Both parse to the same values, so
+# merge_csv_files compares parsed headers rather than header bytes
+ARROW_QUOTING_STYLE = "needed"
+
+# Cleaned text columns are held as Arrow-backed strings when pyarrow is available
+STRING_DTYPE = "string[pyarrow]" if pa is not None else object
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
-def save_to_csv(table_data, output_csv):
+# Punctuation stripped from every cell as a common OCR artifact
+OCR_PUNCTUATION = ',;:"\''
+
+# Runs of punctuation and whitespace, rewritten in a single scan by _clean_run
+CELL_CLEANUP_RE = re.compile(r'(?:[,;:"\']|\s)+')
+
+# Numeric part of a compensation value, with an optional dollar sign
+MONEY_RE = re.compile(r'\$?[\d,\.]+')
+
+# Name cells containing any of these words (case-insensitive) are repeated table headers.
+# Kept as a pattern string: Arrow-backed string columns do not accept a compiled re.Pattern
+HEADER_NAME_PATTERN = r'CLERK|POST|OFFICE'
+
+def _clean_run(match):
+    """Drop the punctuation in a run; any whitespace in it becomes a single space."""
+    return ' ' if match.group(0).strip(OCR_PUNCTUATION) else ''
+
+def save_to_csv(table_data, output_csv, append=False):
     """
     Save processed table data to CSV.
     
+    Rows are cleaned and filtered independently, so a document can be
+    written page by page with append=True instead of all at once.
+    
     Args:
-        table_data: List of dictionaries containing table row data
+        table_data: Dictionary of column lists (as returned by detect_table_structure)
+            or list of dictionaries containing table row data
         output_csv: Path to output CSV file
-    """
-    if not table_data:
-        logger.warning("No table data to save")
-        return
+        append: Append to output_csv, writing the header only if the file is empty
         
+    Returns:
+        Number of rows written
+    """
     # Create DataFrame
     df = pd.DataFrame(table_data)
+    if df.empty:
+        logger.warning("No table data to save")
+        return 0
     
-    # Clean up each column
-    for col in df.columns:
-        # Convert all values to string
-        df[col] = df[col].astype(str)
-        
-        # Replace 'nan' with empty string
-        df[col] = df[col].replace('nan', '')
-        
-        # Remove leading/trailing spaces
-        df[col] = df[col].str.strip()
-        
-        # Clean up common OCR errors - replace common patterns
-        df[col] = df[col].str.replace(r'[,;:"\']', '', regex=True)  # Remove punctuation
-        df[col] = df[col].str.replace(r'\s+', ' ', regex=True)      # Normalize whitespace
+    # Clean up each column in one pass per cell: 'nan' becomes empty, then strip
+    # leading/trailing spaces, remove punctuation and normalize whitespace
+    df = pd.DataFrame({
+        col: ['' if value == 'nan' else CELL_CLEANUP_RE.sub(_clean_run, value.strip())
+              for value in df[col].astype(str)]
+        for col in df.columns
+    }, dtype=STRING_DTYPE)
         
     # Clean up monetary values in the compensation column
     if "Compensation per annum" in df.columns:
-        df["Compensation per annum"] = df["Compensation per annum"].apply(clean_compensation)
+        df["Compensation per annum"] = clean_compensation_column(df["Compensation per annum"])
     
     # Clean up state names
     if "State" in df.columns:
-        df["State"] = df["State"].apply(lambda x: x.strip() if isinstance(x, str) else x)
+        df["State"] = df["State"].str.strip()
     
-    # Filter out rows where Name contains header text
+    # Filter out rows where Name contains header text (Arrow-backed strings evaluate this in C++)
     if "Name" in df.columns:
-        df = df[~df["Name"].str.contains("CLERK|POST|OFFICE", case=False, regex=True)]
+        df = df[~df["Name"].str.contains(HEADER_NAME_PATTERN, case=False, na=False)]
     
     # Additional clean-up: Remove rows where all values except State are empty
     non_state_cols = [col for col in df.columns if col != "State"]
     if non_state_cols:
-        df = df[df[non_state_cols].replace('', pd.NA).notna().any(axis=1)]
+        # Every cell is already a cleaned string, so compare against '' directly
+        df = df.loc[(df[non_state_cols].to_numpy(dtype=object) != '').any(axis=1)]
     
     # Save to CSV
-    df.to_csv(output_csv, index=False)
+    if append:
+        header = not os.path.exists(output_csv) or os.path.getsize(output_csv) == 0
+        _write_csv(df, output_csv, mode='a', header=header)
+    else:
+        _write_csv(df, output_csv)
     logger.info(f"Saved {len(df)} rows to {output_csv}")
+    
+    return len(df)
+
+def save_ocr_lines(ocr_result, output_csv, first_page=0, append=False):
+    """
+    Save the raw OCR text lines, one row per line, without building a DataFrame.
+    
+    Each page is flattened into word arrays once, line confidences are
+    averaged with NumPy, and rows go straight to a buffered csv.writer,
+    which keeps the dump cheap enough to write per batch.
+    
+    Args:
+        ocr_result: The OCR result from DocTR
+        output_csv: Path to output CSV file
+        first_page: Page index of the first page in ocr_result (for batched results)
+        append: Append to output_csv, writing the header only if the file is empty
+        
+    Returns:
+        Number of rows written
+    """
+    header = not append or not os.path.exists(output_csv) or os.path.getsize(output_csv) == 0
+    n_rows = 0
+    
+    with open(output_csv, 'a' if append else 'w', newline='', buffering=1 << 20) as f:
+        writer = csv.writer(f)
+        if header:
+            writer.writerow(('page_num', 'text', 'confidence'))
+        
+        for page_idx, page in enumerate(ocr_result.pages):
+            texts, _, _, confs, line_lens = flatten_page_words(page)
+            
+            # Mean word confidence per line in one pass; lines without words get 0
+            word_lines = np.repeat(np.arange(len(line_lens)), line_lens)
+            conf_sums = np.bincount(word_lines, weights=confs, minlength=len(line_lens))
+            line_confs = (conf_sums / np.maximum(line_lens, 1)).tolist()
+            
+            line_ends = np.cumsum(line_lens).tolist()
+            page_no = first_page + page_idx + 1
+            start = 0
+            for end, conf in zip(line_ends, line_confs):
+                writer.writerow((page_no, " ".join(texts[start:end]), conf))
+                start = end
+            n_rows += len(line_ends)
+    
+    logger.info(f"Saved {n_rows} OCR lines to {output_csv}")
+    return n_rows
+
+def _write_csv(df, output_csv, mode='w', header=True):
+    """
+    Write a DataFrame as CSV, through Arrow's CSV writer when pyarrow is installed.
+    
+    Args:
+        df: DataFrame to write (its index is not written)
+        output_csv: Path to output CSV file
+        mode: 'w' to overwrite or 'a' to append
+        header: Whether to write the header line
+    """
+    if pacsv is None:
+        df.to_csv(output_csv, index=False, mode=mode, header=header)
+        return
+    
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with open(output_csv, mode + 'b') as f:
+        pacsv.write_csv(table, f, write_options=pacsv.WriteOptions(include_header=header,
+                                                                 quoting_style=ARROW_QUOTING_STYLE))
 
 def clean_compensation(value):
     """
@@ -79,7 +190,7 @@ def clean_compensation(value):
         value = value.lower().replace("p.m.", "").strip()
     
     # Extract numeric part with dollar sign
-    match = re.search(r'\$?[\d,\.]+', value)
+    match = MONEY_RE.search(value)
     if match:
         clean_value = match.group(0)
         # Ensure dollar sign is present
@@ -94,6 +205,33 @@ def clean_compensation(value):
         
     return value
 
+def clean_compensation_column(values):
+    """
+    Clean up a column of compensation values; vectorized clean_compensation.
+    
+    Args:
+        values: Series of raw compensation value strings
+        
+    Returns:
+        Series of cleaned compensation values, with the dtype of values
+    """
+    s = values.astype("string").str.strip()
+    
+    # Handle special case of "p.m." notation (postmaster fee)
+    lowered = s.str.lower()
+    is_pm = lowered.str.contains("p.m.", regex=False, na=False)
+    s = s.mask(is_pm, lowered.str.replace("p.m.", "", regex=False).str.strip())
+    
+    # Extract numeric part, ensuring the dollar sign is present
+    amounts = s.str.extract(f"({MONEY_RE.pattern})", expand=False)
+    amounts = amounts.mask(~amounts.str.startswith("$", na=True), "$" + amounts)
+    
+    # Add p.m. back if it was present
+    amounts = amounts.mask(is_pm & amounts.notna(), amounts + " p.m.")
+    
+    # Values without a monetary amount keep their stripped text
+    return amounts.fillna(s).astype(values.dtype)
+
 def merge_csv_files(input_files, output_file):
     """
     Merge multiple CSV files into a single file.
@@ -105,10 +243,41 @@ def merge_csv_files(input_files, output_file):
     if not input_files:
         logger.warning("No input files to merge")
         return
-        
+    
+    # Read each file's column names; empty or unreadable files are skipped. Headers are
+    # compared parsed, since the Arrow and pandas writers quote them differently
+    headers = {}
+    for file in input_files:
+        try:
+            with open(file, 'rb') as f:
+                header = f.readline()
+        except OSError as e:
+            logger.error(f"Error reading {file}: {str(e)}")
+            continue
+        if header.strip():
+            headers[file] = tuple(next(csv.reader([header.decode('utf-8-sig')])))
+        else:
+            logger.error(f"Error reading {file}: file is empty")
+    
+    if not headers:
+        logger.error("No data to merge")
+        return
+    
+    # Files with identical headers are already in the output format, so copy
+    # their bytes instead of parsing and re-serializing them
+    if len(set(headers.values())) == 1:
+        _concat_csv_bytes(list(headers), output_file)
+        return
+    
+    if pacsv is not None:
+        _merge_csv_arrow(headers, output_file)
+        return
+    
+    logger.info("Input files have different columns, merging with pandas")
+    
     # Read all dataframes
     dfs = []
-    for file in input_files:
+    for file in headers:
         try:
             df = pd.read_csv(file)
             dfs.append(df)
@@ -128,4 +297,75 @@ def merge_csv_files(input_files, output_file):
     
     # Save merged data
     merged_df.to_csv(output_file, index=False)
-    logger.info(f"Merged {len(merged_df)} rows into {output_file}")
\ No newline at end of file
+    logger.info(f"Merged {len(merged_df)} rows into {output_file}")
+
+def _merge_csv_arrow(headers, output_file):
+    """
+    Merge CSV files with differing columns using Arrow's multithreaded reader.
+    
+    Every column is read as a string so values are copied verbatim; columns
+    missing from a file are left empty in its rows.
+    
+    Args:
+        headers: Dictionary mapping input CSV file paths to their column names
+        output_file: Path to the output merged CSV file
+    """
+    logger.info("Input files have different columns, merging with pyarrow")
+    
+    tables = []
+    for file, columns in headers.items():
+        convert_options = pacsv.ConvertOptions(column_types={col: pa.string() for col in columns})
+        try:
+            table = pacsv.read_csv(file, convert_options=convert_options)
+        except Exception as e:
+            logger.error(f"Error reading {file}: {str(e)}")
+            continue
+        tables.append(table)
+        logger.info(f"Read {table.num_rows} rows from {file}")
+    
+    if not tables:
+        logger.error("No data to merge")
+        return
+    
+    # Align schemas by column name, filling missing columns with nulls
+    merged = pa.concat_tables(tables, promote_options="default")
+    pacsv.write_csv(merged, output_file,
+                    write_options=pacsv.WriteOptions(quoting_style=ARROW_QUOTING_STYLE))
+    logger.info(f"Merged {merged.num_rows} rows into {output_file}")
+
+def _concat_csv_bytes(input_files, output_file, chunk_size=1 << 20):
+    """
+    Concatenate CSV files that share a header by copying their raw bytes.
+    
+    Args:
+        input_files: List of input CSV file paths with identical header lines
+        output_file: Path to the output merged CSV file
+        chunk_size: Number of bytes copied per read
+    """
+    total_rows = 0
+    with open(output_file, 'wb', buffering=chunk_size) as dst:
+        last_byte = b'\n'
+        for i, file in enumerate(input_files):
+            with open(file, 'rb') as src:
+                header = src.readline()
+                if i == 0:
+                    dst.write(header)
+                    last_byte = header[-1:]
+                
+                # Keep the first row of this file off the previous file's last line
+                if last_byte != b'\n':
+                    dst.write(b'\n')
+                    last_byte = b'\n'
+                
+                rows = 0
+                for chunk in iter(lambda: src.read(chunk_size), b''):
+                    dst.write(chunk)
+                    rows += chunk.count(b'\n')
+                    last_byte = chunk[-1:]
+                if last_byte != b'\n':
+                    rows += 1
+            
+            total_rows += rows
+            logger.info(f"Read {rows} rows from {file}")
+    
+    logger.info(f"Merged {total_rows} rows into {output_file}")
@@ -3,12 +3,80 @@
 import cv2
 import numpy as np
 import os
+import threading
+from types import SimpleNamespace
+import concurrent.futures
 from pathlib import Path
 import logging
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Non-local means parameters: filter strength, template and search window sizes.
+# Smaller windows than the OpenCV defaults (7, 21) keep denoising from dominating preprocessing.
+DENOISE_STRENGTH = 10
+DENOISE_TEMPLATE_WINDOW = 5
+DENOISE_SEARCH_WINDOW = 15
+
+# Run the enhancement steps on cv2.UMat when an OpenCL device is available, so
+# OpenCV dispatches CLAHE, denoising and thresholding to the GPU
+USE_OPENCL = cv2.ocl.haveOpenCL()
+cv2.ocl.setUseOpenCL(USE_OPENCL)
+
+# Processed pages are saved here for inspection when debug logging is enabled
+DEBUG_DIR = Path('data/processed')
+
+# Background writer for debug images, so PNG encoding stays off the preprocessing path
+_debug_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+_debug_dir_ready = False
+
+# CLAHE objects keep internal buffers, so each preprocessing thread gets its own
+_thread_state = threading.local()
+
+def set_num_threads(n_threads=None):
+    """
+    Set how many threads OpenCV's internal parallel loops may use in this process.
+    
+    Left to the caller rather than done at import: a single-process run can
+    give OpenCV every core, while pool workers that already preprocess pages
+    in parallel should keep it to one thread each.
+    
+    Args:
+        n_threads: Number of threads (None for every core)
+    """
+    cv2.setNumThreads(cv2.getNumberOfCPUs() if n_threads is None else n_threads)
+
+def _get_clahe():
+    """Return this thread's CLAHE object, creating it on first use."""
+    clahe = getattr(_thread_state, "clahe", None)
+    if clahe is None:
+        clahe = _thread_state.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+    return clahe
+
+class _ScratchBuffers:
+    """Intermediate images for one page size, reused as OpenCV dst arguments."""
+    
+    def __init__(self, height, width):
+        half = ((height + 1) // 2, (width + 1) // 2)  # cv2.pyrDown output size
+        self.shape = (height, width)
+        self.gray = np.empty(self.shape, np.uint8)
+        self.contrast = np.empty(self.shape, np.uint8)
+        self.small = np.empty(half, np.uint8)
+        self.small_denoised = np.empty(half, np.uint8)
+        self.denoised = np.empty(self.shape, np.uint8)
+        self.thresh = np.empty(self.shape, np.uint8)
+
+# Stands in for the scratch buffers on the OpenCL path, where OpenCV allocates UMats itself
+_NO_SCRATCH = SimpleNamespace(gray=None, contrast=None, small=None, small_denoised=None,
+                              denoised=None, thresh=None)
+
+def _get_scratch(height, width):
+    """Return this thread's scratch buffers, reallocating them when the page size changes."""
+    scratch = getattr(_thread_state, "scratch", None)
+    if scratch is None or scratch.shape != (height, width):
+        scratch = _thread_state.scratch = _ScratchBuffers(height, width)
+    return scratch
+
 def preprocess_document(page_image, page_num):
     """
     Enhanced preprocessing specifically for historical table documents.
@@ -18,7 +86,7 @@ def preprocess_document(page_image, page_num):
         page_num: The page number (used for saving if needed).
     
     Returns:
-        Preprocessed image ready for OCR.
+        Preprocessed image ready for OCR (read-only H x W x 3 view).
     """
     # Convert PIL Image to NumPy array if necessary
     if not isinstance(page_image, (np.ndarray, np.generic)):
@@ -35,39 +103,59 @@ def preprocess_document(page_image, page_num):
     else:
         raise ValueError(f"Unexpected image shape: {page_image.shape}")
     
+    # Pages of the same size reuse this thread's intermediate buffers; only the
+    # returned binary image is freshly allocated, since the caller keeps it
+    height, width = page_image.shape[:2]
+    scratch = _NO_SCRATCH if USE_OPENCL else _get_scratch(height, width)
+    
     # Convert to grayscale
-    img_gray = cv2.cvtColor(page_image, cv2.COLOR_RGB2GRAY)
+    img_gray = cv2.cvtColor(page_image, cv2.COLOR_RGB2GRAY, dst=scratch.gray)
+    
+    # Upload once; every step below then runs on the OpenCL device
+    if USE_OPENCL:
+        img_gray = cv2.UMat(img_gray)
     
     # Apply image enhancements specifically for historical documents
     
     # Step 1: Increase contrast using CLAHE (Contrast Limited Adaptive Histogram Equalization)
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-    img_gray = clahe.apply(img_gray)
+    img_gray = _get_clahe().apply(img_gray, dst=scratch.contrast)
     
-    # Step 2: Denoise the image
-    img_gray = cv2.fastNlMeansDenoising(img_gray, None, 10, 7, 21)
+    # Step 2: Denoise the image at half resolution; non-local means scales with pixel
+    # count, and the scan noise is still self-similar after a 2x pyramid step
+    small = cv2.pyrDown(img_gray, dst=scratch.small)
+    small = cv2.fastNlMeansDenoising(small, scratch.small_denoised, DENOISE_STRENGTH,
+                                     DENOISE_TEMPLATE_WINDOW, DENOISE_SEARCH_WINDOW)
+    img_gray = cv2.pyrUp(small, dst=scratch.denoised, dstsize=(width, height))
     
     # Step 3: Apply adaptive thresholding - better for historical documents with uneven illumination
     binary_img = cv2.adaptiveThreshold(
-        img_gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 15, 8
+        img_gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 15, 8, dst=scratch.thresh
     )
     
     # Step 4: Noise removal and connect broken characters
     kernel = np.ones((1, 1), np.uint8)
     binary_img = cv2.morphologyEx(binary_img, cv2.MORPH_CLOSE, kernel)
     
+    # Download the result back to host memory
+    if USE_OPENCL:
+        binary_img = binary_img.get()
+    
     # Deskewing if needed (uncomment if documents are skewed)
     # binary_img = deskew_image(binary_img)
     
-    # Convert back to RGB for DocTR
-    processed_img = cv2.cvtColor(binary_img, cv2.COLOR_GRAY2RGB)
+    # Present the binary image as RGB for DocTR through a zero-copy, read-only
+    # broadcast view instead of materializing three identical channels
+    processed_img = np.broadcast_to(binary_img[:, :, None], binary_img.shape + (3,))
     
     # Debug: Save processed image
-    debug_dir = Path('data/processed')
-    debug_dir.mkdir(exist_ok=True, parents=True)
-    debug_path = debug_dir / f'processed_page_{page_num}.png'
-    cv2.imwrite(str(debug_path), binary_img)
-    logger.debug(f"Saved processed image to {debug_path}")
+    if logger.isEnabledFor(logging.DEBUG):
+        global _debug_dir_ready
+        if not _debug_dir_ready:
+            DEBUG_DIR.mkdir(exist_ok=True, parents=True)
+            _debug_dir_ready = True
+        debug_path = DEBUG_DIR / f'processed_page_{page_num}.png'
+        _debug_pool.submit(cv2.imwrite, str(debug_path), binary_img)
+        logger.debug(f"Saving processed image to {debug_path}")
     
     return processed_img
 
@@ -75,28 +163,33 @@ def deskew_image(image):
     """
     Deskew an image containing text.
     
+    The skew is the median angle of long, near-horizontal Hough line
+    segments (text baselines and table rules).
+    
     Args:
         image: Grayscale binary image.
         
     Returns:
         Deskewed image.
     """
-    # Find all non-zero points
-    coords = np.column_stack(np.where(image > 0))
-    
-    # Find the minimum area rectangle
-    angle = cv2.minAreaRect(coords)[-1]
-    
-    # Adjust angle
-    if angle < -45:
-        angle = -(90 + angle)
-    else:
-        angle = -angle
+    # Find long, near-horizontal segments on the edge map
+    (h, w) = image.shape[:2]
+    edges = cv2.Canny(image, 50, 150)
+    lines = cv2.HoughLinesP(edges, 1, np.pi / 720, threshold=100, minLineLength=w // 4, maxLineGap=20)
+    if lines is None:
+        return image
+    
+    # Dominant skew angle, ignoring vertical rules and stray diagonals
+    x1, y1, x2, y2 = lines[:, 0].T
+    angles = np.arctan2(y2 - y1, x2 - x1)
+    angles = angles[np.abs(angles) < np.pi / 6]
+    if angles.size == 0:
+        return image
+    angle = np.degrees(np.median(angles))
     
     # Rotate the image
-    (h, w) = image.shape[:2]
     center = (w // 2, h // 2)
     M = cv2.getRotationMatrix2D(center, angle, 1.0)
     rotated = cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
     
-    return rotated
\ No newline at end of file
+    return rotated
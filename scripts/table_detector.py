@@ -1,10 +1,79 @@
 import logging
 import re
+import numpy as np
 from typing import List, Dict, Tuple, Optional
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Lines containing any of these (case-insensitive) are table headers
+HEADER_KEYWORDS = ["CLERKS IN POST", "POST-OFFICE", "POSTAL SERVICE", "Name", "Where born", "Whence"]
+HEADER_RE = re.compile("|".join(re.escape(keyword) for keyword in HEADER_KEYWORDS), re.IGNORECASE)
+
+# List of known states to validate state headings against
+KNOWN_STATES = ["Alabama", "Arizona", "Arkansas", "California", "Colorado",
+                "Connecticut", "Dakota", "Delaware", "Florida", "Georgia"]
+_KNOWN_STATES_LOWER = [(state, state.lower()) for state in KNOWN_STATES]
+
+# Leading row index such as "12."
+INDEX_PREFIX_RE = re.compile(r'^\d+\.')
+
+def flatten_page_words(page) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Flatten a DocTR page into parallel per-word arrays in one traversal.
+    
+    Args:
+        page: A page from a DocTR OCR result
+        
+    Returns:
+        Tuple of (word texts, word x, word y, word confidence, words per line),
+        with lines in block order and lines without words counted as 0
+    """
+    texts, xs, ys, confs, line_lens = [], [], [], [], []
+    for block in page.blocks:
+        for line in block.lines:
+            words = line.words
+            line_lens.append(len(words))
+            for word in words:
+                x, y = word.geometry[0]
+                texts.append(word.value)
+                xs.append(x)
+                ys.append(y)
+                confs.append(word.confidence)
+    
+    return (texts, np.array(xs, dtype=np.float64), np.array(ys, dtype=np.float64),
+            np.array(confs, dtype=np.float64), np.array(line_lens, dtype=np.intp))
+
+def extract_page_lines(page) -> List[Tuple[str, float, float]]:
+    """
+    Flatten a DocTR page into one (text, x, y) tuple per non-empty line.
+    
+    Args:
+        page: A page from a DocTR OCR result
+        
+    Returns:
+        List of (line text, left-most word x, top-most word y) tuples
+    """
+    texts, xs, ys, _, line_lens = flatten_page_words(page)
+    if not texts:
+        return []
+    
+    # Word offset of every line that has words; per-line minima in one reduceat each
+    line_lens = line_lens[line_lens > 0]
+    line_ends = np.cumsum(line_lens)
+    line_starts = line_ends - line_lens
+    x_mins = np.minimum.reduceat(xs, line_starts).tolist()
+    y_mins = np.minimum.reduceat(ys, line_starts).tolist()
+    
+    lines = []
+    for start, end, x_min, y_min in zip(line_starts.tolist(), line_ends.tolist(), x_mins, y_mins):
+        # Skip empty lines
+        line_text = " ".join(texts[start:end]).strip()
+        if line_text:
+            lines.append((line_text, x_min, y_min))
+    
+    return lines
+
 def detect_table_structure(ocr_result, page_num):
     """
     Detect table structure from OCR results.
@@ -15,81 +84,46 @@ def detect_table_structure(ocr_result, page_num):
         page_num: The page number being processed
         
     Returns:
-        A list of dictionaries with structured table data
+        A dictionary mapping each column name (plus "State") to its list of row values
     """
     # Get all text lines with their positions for the current page
-    lines = []
-    page = ocr_result.pages[page_num]
-    
-    for block in page.blocks:
-        for line in block.lines:
-            line_text = " ".join(word.value for word in line.words).strip()
-            
-            # Skip empty lines
-            if not line_text:
-                continue
-                
-            # Get line position (use left-most word and top position)
-            if line.words:
-                x_min = min(word.geometry[0][0] for word in line.words)
-                y_min = min(word.geometry[0][1] for word in line.words)
-            else:
-                continue
-                
-            lines.append({
-                "text": line_text,
-                "x": x_min,
-                "y": y_min
-            })
+    # (position is the left-most word and top position)
+    lines = extract_page_lines(ocr_result.pages[page_num])
     
     # Sort lines by y-position (top to bottom)
-    lines.sort(key=lambda l: l["y"])
+    ys = np.fromiter((line[2] for line in lines), dtype=np.float64, count=len(lines))
+    lines = [lines[i] for i in np.argsort(ys, kind='stable')]
     
     # Extract table headings
     column_names = ["Name", "Where born", "Whence appointed", "Post-office", "Compensation per annum"]
     
     # Identify column boundaries - for this specific table format
     # This assumes a relatively consistent structure across pages
-    columns = []
-    if lines:
-        # Based on typical table structure, define approximate column positions
-        page_width = 1.0  # DocTR uses normalized coordinates (0-1)
-        column_positions = [0.0, 0.36, 0.47, 0.59, 0.7, 1.0]  # Estimated positions based on example
-        
-        for i in range(len(column_positions) - 1):
-            columns.append((column_positions[i], column_positions[i+1]))
+    # DocTR uses normalized coordinates (0-1)
+    column_positions = np.array([0.0, 0.36, 0.47, 0.59, 0.7, 1.0])  # Estimated positions based on example
     
-    # Process table rows
-    table_data = []
+    # Bucket every line into its column at once; -1 or len(column_names) means outside the table
+    xs = np.fromiter((line[1] for line in lines), dtype=np.float64, count=len(lines))
+    line_columns = (np.searchsorted(column_positions, xs, side='right') - 1).tolist()
+    
+    # Process table rows, building one list per column
+    table_data = {col: [] for col in column_names}
+    n_rows = 0
     current_state = None
-    last_values = {col: "" for col in column_names}
-    
-    # Filter out header lines by checking for keywords
-    header_keywords = ["CLERKS IN POST", "POST-OFFICE", "POSTAL SERVICE", "Name", "Where born", "Whence"]
-    
-    for line_idx, line in enumerate(lines):
-        # Skip header lines by checking keywords
-        skip_line = False
-        for keyword in header_keywords:
-            if keyword.upper() in line["text"].upper():
-                skip_line = True
-                break
-                
-        if skip_line:
+    
+    for line_idx, (line_text, line_x, line_y) in enumerate(lines):
+        # Skip header lines by checking keywords (one precompiled, case-insensitive scan)
+        if HEADER_RE.search(line_text):
             continue
             
-        # Check if this is a state heading (e.g., "Alabama." or "Arizona.")
-        if line["x"] < 0.3 and "." in line["text"] and len(line["text"].split()) <= 2:
+        # Check if this is a state heading (e.g., "Alabama." or "Arizona."), cheapest tests first
+        if line_x < 0.3 and "." in line_text and len(line_text.split()) <= 2:
             # Try to extract a clean state name
-            state_candidate = line["text"].strip().rstrip(".")
-            
-            # List of known states to validate against
-            known_states = ["Alabama", "Arizona", "Arkansas", "California", "Colorado",
-                           "Connecticut", "Dakota", "Delaware", "Florida", "Georgia"]
+            state_candidate = line_text.strip().rstrip(".").lower()
             
             # Check if it's a valid state or close to one
-            for state in known_states:
-                if state.lower() in state_candidate.lower():
+            for state, state_lower in _KNOWN_STATES_LOWER:
+                if state_lower in state_candidate:
                     current_state = state
                     logger.info(f"Detected state heading: {current_state}")
                     break
@@ -97,18 +131,13 @@ def detect_table_structure(ocr_result, page_num):
             if current_state:
                 continue
             
-        # Try to categorize this line into columns based on x-position
-        col_idx = None
-        for i, (start, end) in enumerate(columns):
-            if start <= line["x"] < end:
-                col_idx = i
-                break
-                
-        if col_idx is None:
+        # Categorize this line into columns based on x-position
+        col_idx = line_columns[line_idx]
+        if not 0 <= col_idx < len(column_names):
             continue
             
         # Clean up the text - remove punctuation and other common OCR artifacts
-        clean_text = line["text"].strip()
+        clean_text = line_text.strip()
         clean_text = clean_text.replace(".,", "")
         clean_text = clean_text.replace(",", "")
         clean_text = clean_text.replace(":", "")
@@ -118,34 +147,32 @@ def detect_table_structure(ocr_result, page_num):
         clean_text = clean_text.replace("-", "")
         
         # If text starts with digits followed by period, it might be an index - remove it
-        if re.match(r'^\d+\.', clean_text):
-            clean_text = re.sub(r'^\d+\.', '', clean_text).strip()
+        without_index, n_removed = INDEX_PREFIX_RE.subn('', clean_text, count=1)
+        if n_removed:
+            clean_text = without_index.strip()
         
         # If this is the first column, start a new row
         if col_idx == 0:
-            row = {col: "" for col in column_names}
-            row[column_names[col_idx]] = clean_text
-            table_data.append(row)
-        elif table_data:  # Add to current row
-            table_data[-1][column_names[col_idx]] = clean_text
-    
-    # Post-process: Replace "do" indicators and add state context
-    processed_data = []
-    for row in table_data:
-        # Add state information if available
-        row["State"] = current_state
-        
-        # Replace "do" with the value from the previous row
-        for col in column_names:
-            if row[col].lower().strip() == "do":
-                row[col] = last_values[col]
+            for values in table_data.values():
+                values.append("")
+            n_rows += 1
+        if n_rows:  # Add to current row
+            table_data[column_names[col_idx]][-1] = clean_text
+    
+    # Post-process: Replace "do" indicators with the value from the previous row, column by column
+    for values in table_data.values():
+        last_value = ""
+        for i, value in enumerate(values):
+            if value.lower().strip() == "do":
+                values[i] = last_value
             else:
-                last_values[col] = row[col]
-                
-        processed_data.append(row)
+                last_value = value
+    
+    # Add state information if available
+    table_data["State"] = [current_state] * n_rows
     
-    logger.info(f"Extracted {len(processed_data)} table rows from page {page_num}")
-    return processed_data
+    logger.info(f"Extracted {n_rows} table rows from page {page_num}")
+    return table_data
 
 def calibrate_column_positions(ocr_result, page_num=0):
     """
@@ -159,47 +186,20 @@ def calibrate_column_positions(ocr_result, page_num=0):
     Returns:
         Dictionary with stats about x-positions of detected text
     """
-    lines = []
-    page = ocr_result.pages[page_num]
+    lines = extract_page_lines(ocr_result.pages[page_num])
     
-    for block in page.blocks:
-        for line in block.lines:
-            line_text = " ".join(word.value for word in line.words).strip()
-            
-            # Skip empty lines
-            if not line_text:
-                continue
-                
-            # Get line position (use left-most word)
-            if line.words:
-                x_min = min(word.geometry[0][0] for word in line.words)
-            else:
-                continue
-                
-            lines.append({
-                "text": line_text,
-                "x": x_min
-            })
-    
-    # Group by x position (rounded to 2 decimal places)
-    x_positions = {}
-    for line in lines:
-        x_rounded = round(line["x"], 2)
-        if x_rounded not in x_positions:
-            x_positions[x_rounded] = []
-        x_positions[x_rounded].append(line["text"])
-    
-    # Sort by x position
-    sorted_positions = sorted(x_positions.items())
-    
-    # Calculate potential column boundaries
-    breakpoints = []
-    if len(sorted_positions) > 1:
-        for i in range(len(sorted_positions) - 1):
-            x1 = sorted_positions[i][0]
-            x2 = sorted_positions[i + 1][0]
-            if x2 - x1 > 0.05:  # Significant gap
-                breakpoints.append((x1 + x2) / 2)
+    # Distinct x positions (rounded to 2 decimal places), sorted, with each line's group
+    xs = np.round(np.fromiter((line[1] for line in lines), dtype=np.float64, count=len(lines)), 2)
+    uniq, inverse = np.unique(xs, return_inverse=True)
+    
+    # Group line texts by x position, keeping their original order within a group
+    order = np.argsort(inverse, kind='stable')
+    groups = np.split(order, np.cumsum(np.bincount(inverse, minlength=len(uniq)))[:-1])
+    sorted_positions = [(x, [lines[i][0] for i in group]) for x, group in zip(uniq.tolist(), groups)]
+    
+    # Calculate potential column boundaries at the midpoint of every significant gap
+    gaps = np.diff(uniq)
+    breakpoints = ((uniq[:-1] + uniq[1:]) / 2)[gaps > 0.05].tolist()
     
     return {
         "positions": sorted_positions,
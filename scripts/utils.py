@@ -1,13 +1,42 @@
 import os
 import re
+import csv
+import functools
 import logging
 import shutil
 import pandas as pd
 from pathlib import Path
 from typing import List, Dict, Optional
 
+# Optional: Arrow's multithreaded CSV reader/writer (falls back to pandas)
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pc = pacsv = pq = None
+
+# The Arrow paths require pyarrow 14 (see requirements.txt); older versions use pandas
+if pa is not None and int(pa.__version__.split('.')[0]) < 14:
+    pa = pc = pacsv = pq = None
+
+# Arrow quotes every string value and header name, unlike pandas' minimal quoting;
+# the merged CSV parses to the same values either way
+ARROW_QUOTING_STYLE = "needed"
+
 logger = logging.getLogger(__name__)
 
+# Merged Parquet columns with at most this distinct/total ratio (states, birthplaces,
+# post offices) are stored dictionary-encoded, so pandas reads them back as categoricals
+DICTIONARY_MAX_UNIQUE_RATIO = 0.5
+
+# "p.m." (postmaster fee) notation, with or without the inner space
+PM_RE = re.compile(r'p\. ?m\.', re.IGNORECASE)
+
+# Numeric part of a compensation value, with an optional dollar sign
+MONEY_RE = re.compile(r'\$?[\d,.]+')
+
 def ensure_dir(directory: str) -> None:
     """
     Ensure a directory exists, creating it if necessary.
@@ -17,32 +46,273 @@ def ensure_dir(directory: str) -> None:
     """
     os.makedirs(directory, exist_ok=True)
 
-def merge_csvs(csv_files: List[str], output_file: str) -> None:
+def merge_csvs(csv_files: List[str], output_file: str, format: Optional[str] = None) -> None:
     """
     Merge multiple CSV files into a single file.
     
+    Files are written to the output one at a time, so peak memory is one
+    input file rather than all of them. Each file is read completely before
+    any of its rows are written, so a file that fails to parse is skipped
+    as a whole. Columns are aligned by name; a column missing from a file is
+    left empty in its rows.
+    
     Args:
         csv_files: List of CSV file paths
-        output_file: Path to save the merged CSV
+        output_file: Path to save the merged CSV or Parquet file
+        format: "csv" or "parquet" (zstd-compressed); None picks Parquet for a
+            .parquet output_file and CSV otherwise
     """
-    dfs = []
+    format = _output_format(output_file, format)
+    
+    # Read every header first, so the merged columns are known before writing
+    file_columns = {}
     for file in csv_files:
         try:
-            df = pd.read_csv(file)
-            dfs.append(df)
+            file_columns[file] = _read_csv_header(file)
         except Exception as e:
             logger.error(f"Error reading {file}: {str(e)}")
     
-    if not dfs:
+    if not file_columns:
         logger.error("No CSV files could be read")
         return
     
-    # Concatenate dataframes
-    merged_df = pd.concat(dfs, ignore_index=True)
+    columns = list(dict.fromkeys(col for cols in file_columns.values() for col in cols))
+    
+    if pacsv is not None:
+        total_rows = _merge_csvs_arrow(file_columns, columns, output_file, format)
+    elif format == "parquet":
+        # Without pyarrow there is no streaming Parquet writer, so concatenate in memory
+        dfs = []
+        for file in file_columns:
+            try:
+                dfs.append(pd.read_csv(file, dtype=str))
+            except Exception as e:
+                logger.error(f"Error reading {file}: {str(e)}")
+        if not dfs:
+            logger.error("No CSV files could be read")
+            return
+        merged_df = pd.concat(dfs, ignore_index=True).reindex(columns=columns)
+        merged_df.to_parquet(output_file, index=False, compression="zstd")
+        total_rows = len(merged_df)
+    else:
+        total_rows = 0
+        with open(output_file, 'w', newline='') as fh:
+            csv.writer(fh).writerow(columns)
+            for file in file_columns:
+                try:
+                    df = pd.read_csv(file, dtype=str)
+                except Exception as e:
+                    logger.error(f"Error reading {file}: {str(e)}")
+                    continue
+                df.reindex(columns=columns).to_csv(fh, header=False, index=False)
+                total_rows += len(df)
+    
+    logger.info(f"Merged {total_rows} rows from {len(file_columns)} files into {output_file}")
+
+def _output_format(output_file: str, format: Optional[str]) -> str:
+    """Resolve the merged output format, defaulting to the output file's suffix."""
+    if format is None:
+        format = "parquet" if Path(output_file).suffix.lower() == ".parquet" else "csv"
+    if format not in ("csv", "parquet"):
+        raise ValueError(f"Unsupported output format: {format}")
+    return format
+
+def _read_csv_header(csv_file: str) -> List[str]:
+    """
+    Read the column names from a CSV file's header line.
+    
+    Args:
+        csv_file: CSV file path
+        
+    Returns:
+        List of column names
+    """
+    with open(csv_file, newline='', encoding='utf-8-sig') as f:
+        columns = next(csv.reader(f), None)
+    if not columns:
+        raise ValueError("file is empty")
+    return columns
+
+def _merge_csvs_arrow(file_columns: Dict[str, List[str]], columns: List[str], output_file: str,
+                      format: str = "csv") -> int:
+    """
+    Merge CSV files through Arrow: each file is read completely by the
+    multithreaded reader, then its columns are written out in merged order.
+    
+    Args:
+        file_columns: Dictionary mapping each CSV file path to its columns
+        columns: Merged column order
+        output_file: Path to save the merged CSV or Parquet file
+        format: "csv" or "parquet"
+        
+    Returns:
+        Number of rows written
+    """
+    # Every column is read as a string, so values are copied verbatim
+    schema = pa.schema([(col, pa.string()) for col in columns])
+    writer = None
+    total_rows = 0
+    try:
+        for file, file_cols in file_columns.items():
+            convert_options = pacsv.ConvertOptions(column_types={col: pa.string() for col in file_cols})
+            try:
+                table = pacsv.read_csv(file, convert_options=convert_options)
+            except Exception as e:
+                logger.error(f"Error reading {file}: {str(e)}")
+                continue
+            
+            # Lay the table out in the merged column order, filling missing columns with nulls
+            arrays = [table.column(file_cols.index(col)) if col in file_cols
+                      else pa.chunked_array([pa.nulls(table.num_rows, pa.string())]) for col in columns]
+            
+            # The first readable file fixes the output schema
+            if writer is None:
+                if format == "parquet":
+                    schema = _dictionary_schema(schema, arrays)
+                writer = _open_merge_writer(output_file, schema, format)
+            
+            arrays = [array.dictionary_encode() if pa.types.is_dictionary(field.type) else array
+                      for array, field in zip(arrays, schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            total_rows += table.num_rows
+        
+        # No file had readable rows: still leave a valid, empty output
+        if writer is None:
+            writer = _open_merge_writer(output_file, schema, format)
+    finally:
+        if writer is not None:
+            writer.close()
     
-    # Save merged file
-    merged_df.to_csv(output_file, index=False)
-    logger.info(f"Merged {len(merged_df)} rows from {len(dfs)} files into {output_file}")
+    return total_rows
+
+def _open_merge_writer(output_file: str, schema: "pa.Schema", format: str):
+    """Open the Arrow CSV or zstd Parquet writer for a merged output."""
+    if format == "parquet":
+        return pq.ParquetWriter(output_file, schema, compression="zstd")
+    return pacsv.CSVWriter(output_file, schema,
+                           write_options=pacsv.WriteOptions(quoting_style=ARROW_QUOTING_STYLE))
+
+def _dictionary_schema(schema: "pa.Schema", arrays: List["pa.ChunkedArray"]) -> "pa.Schema":
+    """
+    Switch low-cardinality string columns of a merged schema to dictionary type.
+    
+    Cardinality is sampled from the first file's columns; a column missing
+    from that file stays a plain string.
+    
+    Args:
+        schema: Merged all-string schema
+        arrays: The first file's columns, in schema order
+        
+    Returns:
+        Schema with dictionary<int32, string> for the low-cardinality columns
+    """
+    fields = []
+    for field, array in zip(schema, arrays):
+        n_values = len(array) - array.null_count
+        if n_values and pc.count_distinct(array).as_py() <= DICTIONARY_MAX_UNIQUE_RATIO * n_values:
+            field = field.with_type(pa.dictionary(pa.int32(), pa.string()))
+        fields.append(field)
+    return pa.schema(fields)
+
+# List of valid US states and territories (historical context - 1880s)
+VALID_STATES = frozenset({
+    "Alabama", "Arizona", "Arkansas", "California", "Colorado", "Connecticut",
+    "Dakota", "Delaware", "Florida", "Georgia", "Idaho", "Illinois", "Indiana",
+    "Iowa", "Kansas", "Kentucky", "Louisiana", "Maine", "Maryland", "Massachusetts",
+    "Michigan", "Minnesota", "Mississippi", "Missouri", "Montana", "Nebraska",
+    "Nevada", "New Hampshire", "New Jersey", "New Mexico", "New York", "North Carolina",
+    "Ohio", "Oregon", "Pennsylvania", "Rhode Island", "South Carolina", "Tennessee",
+    "Texas", "Utah", "Vermont", "Virginia", "Washington", "West Virginia",
+    "Wisconsin", "Wyoming", "Alaska", "District of Columbia"
+})
+
+# Common abbreviations or misspellings, matched as prefixes of the cleaned text
+STATE_ABBREVIATIONS = {
+    "Ala": "Alabama",
+    "Ariz": "Arizona",
+    "Ark": "Arkansas",
+    "Cal": "California",
+    "Calif": "California",
+    "Col": "Colorado",
+    "Colo": "Colorado",
+    "Conn": "Connecticut",
+    "Dak": "Dakota",
+    "Del": "Delaware",
+    "Fla": "Florida",
+    "Ga": "Georgia",
+    "Ill": "Illinois",
+    "Ind": "Indiana",
+    "Kan": "Kansas",
+    "Ky": "Kentucky",
+    "La": "Louisiana",
+    "Md": "Maryland",
+    "Mass": "Massachusetts",
+    "Mich": "Michigan",
+    "Minn": "Minnesota",
+    "Miss": "Mississippi",
+    "Mo": "Missouri",
+    "Mont": "Montana",
+    "Neb": "Nebraska",
+    "Nev": "Nevada",
+    "N.H": "New Hampshire",
+    "N. H": "New Hampshire",
+    "N.J": "New Jersey",
+    "N. J": "New Jersey",
+    "N.M": "New Mexico",
+    "N. M": "New Mexico",
+    "N.Y": "New York",
+    "N. Y": "New York",
+    "N.C": "North Carolina",
+    "N. C": "North Carolina",
+    "N.D": "North Dakota",
+    "N. D": "North Dakota",
+    "Okla": "Oklahoma",
+    "Ore": "Oregon",
+    "Pa": "Pennsylvania",
+    "Penn": "Pennsylvania",
+    "R.I": "Rhode Island",
+    "R. I": "Rhode Island",
+    "S.C": "South Carolina",
+    "S. C": "South Carolina",
+    "S.D": "South Dakota",
+    "S. D": "South Dakota",
+    "Tenn": "Tennessee",
+    "Tex": "Texas",
+    "Vt": "Vermont",
+    "Va": "Virginia",
+    "Wash": "Washington",
+    "W.V": "West Virginia",
+    "W. V": "West Virginia",
+    "W.Va": "West Virginia",
+    "W. Va": "West Virginia",
+    "Wis": "Wisconsin",
+    "Wyo": "Wyoming",
+    "D.C": "District of Columbia",
+    "D. C": "District of Columbia"
+}
+
+def _build_state_trie(mapping: Dict[str, str]) -> Dict:
+    """
+    Build a character trie over the abbreviation prefixes.
+    
+    Each node maps a character to its child node; a node that ends an
+    abbreviation also stores its full state name under "_full".
+    
+    Args:
+        mapping: Dictionary of abbreviation prefixes to full state names
+        
+    Returns:
+        Root node of the trie
+    """
+    root = {}
+    for abbr, full_name in mapping.items():
+        node = root
+        for char in abbr:
+            node = node.setdefault(char, {})
+        node["_full"] = full_name
+    return root
+
+_STATE_TRIE = _build_state_trie(STATE_ABBREVIATIONS)
 
 def get_cleaned_state_name(state_text: str) -> Optional[str]:
     """
@@ -57,93 +327,38 @@ def get_cleaned_state_name(state_text: str) -> Optional[str]:
     if not state_text or not isinstance(state_text, str):
         return None
     
+    return _clean_state_name(state_text)
+
+@functools.lru_cache(maxsize=4096)
+def _clean_state_name(state_text: str) -> str:
+    """
+    Cached lookup behind get_cleaned_state_name; OCR output repeats the
+    same few dozen state strings across every row.
+    
+    Args:
+        state_text: Non-empty text containing a state name
+        
+    Returns:
+        Cleaned state name
+    """
     # Remove trailing period if present
     state = state_text.strip().rstrip(".")
     
-    # List of valid US states and territories (historical context - 1880s)
-    valid_states = {
-        "Alabama", "Arizona", "Arkansas", "California", "Colorado", "Connecticut",
-        "Dakota", "Delaware", "Florida", "Georgia", "Idaho", "Illinois", "Indiana",
-        "Iowa", "Kansas", "Kentucky", "Louisiana", "Maine", "Maryland", "Massachusetts",
-        "Michigan", "Minnesota", "Mississippi", "Missouri", "Montana", "Nebraska",
-        "Nevada", "New Hampshire", "New Jersey", "New Mexico", "New York", "North Carolina",
-        "Ohio", "Oregon", "Pennsylvania", "Rhode Island", "South Carolina", "Tennessee",
-        "Texas", "Utah", "Vermont", "Virginia", "Washington", "West Virginia",
-        "Wisconsin", "Wyoming", "Alaska", "District of Columbia"
-    }
-    
     # Check if it's a valid state
-    if state in valid_states:
+    if state in VALID_STATES:
         return state
     
-    # Check for common abbreviations or misspellings
-    state_mapping = {
-        "Ala": "Alabama",
-        "Ariz": "Arizona",
-        "Ark": "Arkansas",
-        "Cal": "California",
-        "Calif": "California",
-        "Col": "Colorado",
-        "Colo": "Colorado",
-        "Conn": "Connecticut",
-        "Dak": "Dakota",
-        "Del": "Delaware",
-        "Fla": "Florida",
-        "Ga": "Georgia",
-        "Ill": "Illinois",
-        "Ind": "Indiana",
-        "Kan": "Kansas",
-        "Ky": "Kentucky",
-        "La": "Louisiana",
-        "Md": "Maryland",
-        "Mass": "Massachusetts",
-        "Mich": "Michigan",
-        "Minn": "Minnesota",
-        "Miss": "Mississippi",
-        "Mo": "Missouri",
-        "Mont": "Montana",
-        "Neb": "Nebraska",
-        "Nev": "Nevada",
-        "N.H": "New Hampshire",
-        "N. H": "New Hampshire",
-        "N.J": "New Jersey",
-        "N. J": "New Jersey",
-        "N.M": "New Mexico",
-        "N. M": "New Mexico",
-        "N.Y": "New York",
-        "N. Y": "New York",
-        "N.C": "North Carolina",
-        "N. C": "North Carolina",
-        "N.D": "North Dakota",
-        "N. D": "North Dakota",
-        "Okla": "Oklahoma",
-        "Ore": "Oregon",
-        "Pa": "Pennsylvania",
-        "Penn": "Pennsylvania",
-        "R.I": "Rhode Island",
-        "R. I": "Rhode Island",
-        "S.C": "South Carolina",
-        "S. C": "South Carolina",
-        "S.D": "South Dakota",
-        "S. D": "South Dakota",
-        "Tenn": "Tennessee",
-        "Tex": "Texas",
-        "Vt": "Vermont",
-        "Va": "Virginia",
-        "Wash": "Washington",
-        "W.V": "West Virginia",
-        "W. V": "West Virginia",
-        "W.Va": "West Virginia",
-        "W. Va": "West Virginia",
-        "Wis": "Wisconsin",
-        "Wyo": "Wyoming",
-        "D.C": "District of Columbia",
-        "D. C": "District of Columbia"
-    }
-    
-    for abbr, full_name in state_mapping.items():
-        if state.startswith(abbr):
-            return full_name
+    # Check for common abbreviations or misspellings: walk the trie along the text,
+    # keeping the longest abbreviation it starts with (so "Mont" is Montana, not "Mo")
+    node = _STATE_TRIE
+    match = None
+    for char in state:
+        node = node.get(char)
+        if node is None:
+            break
+        match = node.get("_full", match)
+    if match is not None:
+        return match
     
     return state  # Return as-is if not recognized
 
@@ -164,13 +379,12 @@ def clean_compensation_value(value: str) -> str:
     value = value.strip()
     
     # Handle "p.m." notation (postmaster fee)
-    is_pm = False
-    if "p.m." in value.lower() or "p. m." in value.lower():
-        is_pm = True
-        value = re.sub(r'p\.m\.|p\. m\.', '', value.lower(), flags=re.IGNORECASE).strip()
+    is_pm = PM_RE.search(value) is not None
+    if is_pm:
+        value = PM_RE.sub('', value.lower()).strip()
     
     # Extract numeric part with dollar sign
-    match = re.search(r'\$?[\d,\.]+', value)
+    match = MONEY_RE.search(value)
     if match:
         clean_value = match.group(0)
         
@@ -212,8 +426,8 @@ def backup_file(file_path: str, backup_dir: str = "backups") -> str:
     file_name = os.path.basename(file_path)
     backup_file = backup_path / file_name
     
-    # Copy file to backup
+    # Copy file to backup (copy2 already copies the data in-kernel on Linux)
     shutil.copy2(file_path, backup_file)
     logger.info(f"Backed up {file_path} to {backup_file}")
     
-    return str(backup_file)
\ No newline at end of file
+    return str(backup_file)
@@ -1,11 +1,19 @@
 import os
+import concurrent.futures
+import numpy as np
 import pandas as pd
 import argparse
 import logging
-from pathlib import Path
 import re
 from typing import Dict, List, Set, Tuple
 
+# Optional: pyarrow writes the report as Parquet with native list columns
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -17,6 +25,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Columns of an extracted postal table; validation reads only these
+EXPECTED_COLUMNS = [
+    "Name", "Where born", "Whence appointed", "Post-office",
+    "Compensation per annum", "State"
+]
+
+# A valid compensation value starts with a dollar sign or carries the "p.m." notation
+COMPENSATION_VALID_RE = re.compile(r'^\$|\bp\.m\.|^nan$')
+
+# Below this many rows, a plain loop over the values beats pandas' string dispatch
+SMALL_FRAME_ROWS = 10_000
+
+def _compensation_valid_mask(comp_col: pd.Series) -> np.ndarray:
+    """
+    Flag the compensation values that match COMPENSATION_VALID_RE (missing values count as valid).
+    
+    Small columns are checked with a list comprehension over the values;
+    larger ones go through pandas' str.contains.
+    
+    Args:
+        comp_col: Column of compensation strings
+        
+    Returns:
+        Boolean array, True where the value is valid
+    """
+    if len(comp_col) < SMALL_FRAME_ROWS:
+        search = COMPENSATION_VALID_RE.search
+        return np.array([not isinstance(value, str) or search(value) is not None
+                         for value in comp_col.tolist()], dtype=bool)
+    
+    return comp_col.str.contains(COMPENSATION_VALID_RE, na=True).to_numpy(dtype=bool)
+
 def validate_csv_file(csv_path: str) -> Dict:
     """
     Validate a single CSV file extracted from postal tables.
@@ -35,45 +75,47 @@ def validate_csv_file(csv_path: str) -> Dict:
         "row_count": 0
     }
     
+    logger.info(f"Validating {csv_path}")
+    
     try:
-        # Read the CSV file
-        df = pd.read_csv(csv_path)
+        # Read the CSV file: only the expected columns, all as strings (no type inference)
+        df = pd.read_csv(csv_path, usecols=lambda col: col in EXPECTED_COLUMNS, dtype=str, engine="c")
         result["row_count"] = len(df)
         
-        # Expected columns
-        expected_columns = {
-            "Name", "Where born", "Whence appointed", "Post-office", 
-            "Compensation per annum", "State"
-        }
-        
         # Check column presence
-        missing_columns = expected_columns - set(df.columns)
+        missing_columns = [col for col in EXPECTED_COLUMNS if col not in df.columns]
         if missing_columns:
             result["valid"] = False
             result["issues"].append(f"Missing columns: {', '.join(missing_columns)}")
         
-        # Check for empty values
-        for col in df.columns:
-            empty_count = df[col].isna().sum()
+        # Check every column in a single pass for empty and unresolved "do" values.
+        # OCR columns repeat a few values heavily, so string columns are counted once
+        # per distinct value through their categorical codes (missing values are -1)
+        for col, series in df.items():
+            if series.dtype == 'object':  # Only check string columns for "do"
+                values = series.astype('category')
+                counts = np.bincount(values.cat.codes.to_numpy() + 1,
+                                     minlength=len(values.cat.categories) + 1)
+                is_do = values.cat.categories.str.lower().str.strip() == "do"
+                empty_count = int(counts[0])
+                do_count = int(counts[1:][is_do].sum())
+            else:
+                empty_count = int(series.isna().sum())
+                do_count = 0
+            
             if empty_count > 0:
                 result["warnings"].append(f"Column '{col}' has {empty_count} empty values")
-        
-        # Check for unresolved "do" values
-        for col in df.columns:
-            if df[col].dtype == 'object':  # Only check string columns
-                do_count = df[df[col].str.lower().str.strip() == "do"].shape[0]
-                if do_count > 0:
-                    result["valid"] = False
-                    result["issues"].append(f"Found {do_count} unresolved 'do' values in column '{col}'")
+            if do_count > 0:
+                result["valid"] = False
+                result["issues"].append(f"Found {do_count} unresolved 'do' values in column '{col}'")
         
         # Validate specific columns
         if "Compensation per annum" in df.columns:
-            # Clean the compensation column
-            comp_col = df["Compensation per annum"].astype(str)
+            comp_col = df["Compensation per annum"]
             
             # Check for invalid compensation values (should contain dollar sign or be empty)
-            invalid_comp = ~comp_col.str.contains(r'^\$|\bp\.m\.|^nan$', regex=True, na=True)
-            invalid_count = invalid_comp.sum()
+            invalid_comp = ~_compensation_valid_mask(comp_col)
+            invalid_count = int(invalid_comp.sum())
             
             if invalid_count > 0:
                 result["warnings"].append(f"{invalid_count} rows have suspicious compensation values")
@@ -83,14 +125,12 @@ def validate_csv_file(csv_path: str) -> Dict:
         
         # Check state consistency
         if "State" in df.columns and "Where born" in df.columns:
-            state_mismatch = 0
-            for _, row in df.iterrows():
-                state = str(row.get("State", "")) if not pd.isna(row.get("State", "")) else ""
-                born = str(row.get("Where born", "")) if not pd.isna(row.get("Where born", "")) else ""
-                
-                if born != "do" and state and born and state.lower() != born.lower():
-                    # There might be legitimate reasons for this, so just count as warning
-                    state_mismatch += 1
+            state = df["State"].fillna("").astype(str)
+            born = df["Where born"].fillna("").astype(str)
+            
+            # There might be legitimate reasons for a mismatch, so just count as warning
+            mismatch = (born != "do") & (state != "") & (born != "") & (state.str.lower() != born.str.lower())
+            state_mismatch = int(mismatch.sum())
             
             if state_mismatch > 0:
                 result["warnings"].append(f"{state_mismatch} rows have potential state/birthplace mismatches")
@@ -102,19 +142,48 @@ def validate_csv_file(csv_path: str) -> Dict:
     
     return result
 
-def validate_directory(input_dir: str, report_path: str = None) -> pd.DataFrame:
+def _write_parquet_report(validation_results: List[Dict], report_path: str) -> None:
+    """
+    Write validation results straight from their dicts to Parquet through Arrow.
+    
+    Issues and warnings are stored as list<string> columns rather than as
+    the stringified lists of the CSV report.
+    
+    Args:
+        validation_results: List of validate_csv_file results
+        report_path: Path to save the Parquet report
+    """
+    if pa is None:
+        raise ImportError("pyarrow is required to write a Parquet validation report")
+    
+    schema = pa.schema([
+        ("file", pa.string()),
+        ("valid", pa.bool_()),
+        ("issues", pa.list_(pa.string())),
+        ("warnings", pa.list_(pa.string())),
+        ("row_count", pa.int64()),
+    ])
+    pq.write_table(pa.Table.from_pylist(validation_results, schema=schema), report_path)
+
+def validate_directory(input_dir: str, report_path: str = None, max_workers: int = None) -> pd.DataFrame:
     """
     Validate all CSV files in the directory and generate a report.
     
+    Files are independent, so they are validated in parallel on a process pool.
+    
     Args:
         input_dir: Directory containing CSV files to validate
-        report_path: Path to save the validation report (optional)
+        report_path: Path to save the validation report (optional); a .parquet
+            path writes Parquet, anything else CSV
+        max_workers: Number of parallel workers, or None for the CPU count
         
     Returns:
         DataFrame with validation results
     """
-    input_path = Path(input_dir)
-    all_files = list(input_path.glob("*.csv"))
+    # Plain path strings straight from the directory entries (no Path objects or extra stat calls)
+    with os.scandir(input_dir) as entries:
+        all_files = [entry.path for entry in entries
+                     if entry.name.endswith(".csv") and entry.is_file(follow_symlinks=False)]
     
     if not all_files:
         logger.warning(f"No CSV files found in {input_dir}")
@@ -122,18 +191,22 @@ def validate_directory(input_dir: str, report_path: str = None) -> pd.DataFrame:
     
     logger.info(f"Validating {len(all_files)} CSV files")
     
-    # Validate each file
-    validation_results = []
-    for file_path in all_files:
-        logger.info(f"Validating {file_path}")
-        result = validate_csv_file(str(file_path))
-        validation_results.append(result)
+    # Validate each file; map keeps the results in file order
+    max_workers = min(max_workers or os.cpu_count() or 1, len(all_files))
+    if max_workers > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            validation_results = list(executor.map(validate_csv_file, all_files, chunksize=4))
+    else:
+        validation_results = [validate_csv_file(file_path) for file_path in all_files]
     
     # Create report DataFrame
     report_df = pd.DataFrame(validation_results)
     
     # Save report if requested
-    if report_path:
+    if report_path and report_path.lower().endswith(".parquet"):
+        _write_parquet_report(validation_results, report_path)
+        logger.info(f"Validation report saved to {report_path}")
+    elif report_path:
         report_df.to_csv(report_path, index=False)
         logger.info(f"Validation report saved to {report_path}")
     
@@ -156,9 +229,10 @@ def main():
     parser = argparse.ArgumentParser(description="Validate extracted CSV files from historical postal tables")
     parser.add_argument('--input_dir', type=str, required=True, help='Directory containing CSV files to validate')
     parser.add_argument('--report', type=str, default="validation_report.csv", help='Path to save validation report')
+    parser.add_argument('--workers', type=int, default=None, help='Number of parallel workers (default: based on CPU count)')
     
     args = parser.parse_args()
-    validate_directory(args.input_dir, args.report)
+    validate_directory(args.input_dir, args.report, args.workers)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file